@@ -0,0 +1,162 @@
+import os
+import uuid
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from database import DAILY_COLUMNS, HOURLY_COLUMNS, epoch_seconds, get_engine
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.path.join(BASE_DIR, "archive")
+TABLE_COLUMNS = {"hourly": HOURLY_COLUMNS, "daily": DAILY_COLUMNS}
+
+# Rows are archived once their whole month is at least this old
+ARCHIVE_AFTER_DAYS = 30
+
+# city and month live in the directory names (Hive style), so a query for
+# one city or a time window only opens the files it needs
+PARTITIONING = ds.partitioning(
+    pa.schema([("city", pa.string()), ("month", pa.string())]),
+    flavor="hive",
+    dictionaries="infer")
+
+
+def file_schema(columns):
+    return pa.schema(
+        [("time", pa.timestamp("s", tz="UTC"))] + [(column, pa.float32()) for column in columns])
+
+
+def partition_path(table, city_name, month, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, table, f"city={quote(city_name, safe='')}", f"month={month}")
+
+
+def _utc(value):
+    timestamp = pd.Timestamp(value, unit="s") if isinstance(value, (int, np.integer)) else pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+def month_start(timestamp):
+    return _utc(timestamp).normalize().replace(day=1)
+
+
+def write_partition(table, city_name, month, frame, archive_dir=ARCHIVE_DIR):
+    # Rows already archived for the month are merged in; newer values win.
+    # The file is written under a temporary name and swapped in, so readers
+    # never see a half-written partition
+    columns = TABLE_COLUMNS[table]
+    directory = partition_path(table, city_name, month, archive_dir)
+    path = os.path.join(directory, "part-0.parquet")
+    frame = frame[["date"] + columns].rename(columns={"date": "time"})
+    if os.path.exists(path):
+        existing = pq.read_table(path).to_pandas()
+        frame = pd.concat([existing, frame], ignore_index=True)
+    frame = frame.drop_duplicates("time", keep="last").sort_values("time")
+
+    arrays = [pa.array(epoch_seconds(frame["time"]), pa.int64()).cast(pa.timestamp("s", tz="UTC"))]
+    arrays += [pa.array(frame[column].to_numpy(np.float32)) for column in columns]
+    os.makedirs(directory, exist_ok=True)
+    temporary = os.path.join(directory, f".{uuid.uuid4().hex}.tmp")
+    pq.write_table(
+        pa.Table.from_arrays(arrays, schema=file_schema(columns)),
+        temporary,
+        compression="zstd",
+        use_dictionary=True)
+    os.replace(temporary, path)
+    return len(frame)
+
+
+def compact(table="hourly", older_than_days=ARCHIVE_AFTER_DAYS, now=None, engine=None, archive_dir=ARCHIVE_DIR):
+    # Moves whole months older than the cutoff out of SQLite into Parquet.
+    # Rows are only deleted after their partition files are in place; if
+    # that step is interrupted the next run merges them again harmlessly.
+    # Rows without a city name (from before names were stored) stay put
+    columns = TABLE_COLUMNS[table]
+    now = pd.Timestamp.now(tz="UTC") if now is None else _utc(now)
+    cutoff = month_start(now - pd.Timedelta(days=older_than_days))
+    cutoff_epoch = int(cutoff.timestamp())
+    engine = engine or get_engine()
+
+    with engine.connect() as connection:
+        locations = connection.exec_driver_sql(
+            f"SELECT DISTINCT l.location_id, l.city_name FROM {table} t "
+            f"JOIN locations l ON l.location_id = t.location_id "
+            f"WHERE t.time < ? AND l.city_name != ''", (cutoff_epoch,)).fetchall()
+
+    archived = 0
+    for location_id, city_name in locations:
+        with engine.connect() as connection:
+            # Plain sqlite3 tuples convert to an array far faster than Row objects
+            rows = connection.connection.driver_connection.execute(
+                f"SELECT time, {', '.join(columns)} FROM {table} "
+                f"WHERE location_id = ? AND time < ? ORDER BY time",
+                (location_id, cutoff_epoch)).fetchall()
+        values = np.array(rows, dtype=np.float64)
+        frame = pd.DataFrame({"date": pd.to_datetime(values[:, 0].astype(np.int64), unit="s", utc=True)})
+        for i, column in enumerate(columns):
+            frame[column] = values[:, i + 1].astype(np.float32)
+
+        months = frame["date"].dt.strftime("%Y-%m")
+        for month, month_frame in frame.groupby(months, sort=False):
+            write_partition(table, city_name, month, month_frame, archive_dir)
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                f"DELETE FROM {table} WHERE location_id = ? AND time < ?",
+                (location_id, cutoff_epoch))
+        archived += len(frame)
+    return archived
+
+
+def open_archive(table, archive_dir=ARCHIVE_DIR):
+    directory = os.path.join(archive_dir, table)
+    if not os.path.isdir(directory):
+        return None
+    return ds.dataset(
+        directory,
+        format="parquet",
+        partitioning=PARTITIONING,
+        exclude_invalid_files=True)
+
+
+def _filter(city_name, start, end):
+    # Partition keys prune directories; the time bounds are checked against
+    # Parquet row group statistics before any column data is read
+    expression = ds.field("city") == city_name
+    if start is not None:
+        start = _utc(start)
+        expression &= ds.field("month") >= start.strftime("%Y-%m")
+        expression &= ds.field("time") >= pa.scalar(start.to_pydatetime(), pa.timestamp("s", tz="UTC"))
+    if end is not None:
+        end = _utc(end)
+        expression &= ds.field("month") <= end.strftime("%Y-%m")
+        expression &= ds.field("time") < pa.scalar(end.to_pydatetime(), pa.timestamp("s", tz="UTC"))
+    return expression
+
+
+def _batch_frame(batch, city_name, columns):
+    # Parquet has no second resolution; times come back as milliseconds
+    seconds = batch.column("time").cast(pa.timestamp("s", tz="UTC")).cast(pa.int64()).to_numpy()
+    data = {"date": pd.to_datetime(seconds, unit="s", utc=True), "city_name": city_name}
+    for column in columns:
+        data[column] = batch.column(column).to_numpy(zero_copy_only=False)
+    return pd.DataFrame(data)
+
+
+def iter_archive(table, city_name, start=None, end=None, columns=None, chunk_rows=50000, archive_dir=ARCHIVE_DIR):
+    dataset = open_archive(table, archive_dir)
+    if dataset is None:
+        return
+    columns = list(columns or TABLE_COLUMNS[table])
+    scanner = dataset.scanner(
+        columns=["time"] + columns,
+        filter=_filter(city_name, start, end),
+        batch_size=chunk_rows)
+    # Files are visited in path order, which is month order within a city
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield _batch_frame(batch, city_name, columns)
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+
+import aiohttp
+from openmeteo_requests.Client import OpenMeteoRequestsError
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+
+from weather_api import (
+    FORECAST_URL,
+    MAX_LOCATIONS_PER_REQUEST,
+    MAX_URL_LENGTH,
+    chunk_coordinates,
+    forecast_params,
+)
+
+RETRY_STATUSES = (500, 502, 504)
+
+
+def decode_responses(data):
+    # Same framing as openmeteo_requests: each message is a little-endian
+    # length prefix followed by a WeatherApiResponse flatbuffer
+    messages = []
+    pos = 0
+    while pos < len(data):
+        length = int.from_bytes(data[pos:pos + 4], byteorder="little")
+        messages.append(WeatherApiResponse.GetRootAs(data, pos + 4))
+        pos += length + 4
+    return messages
+
+
+def _query(params):
+    # aiohttp wants flat (key, value) pairs; lists become repeated keys
+    query = [("format", "flatbuffers")]
+    for key, value in params.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        query.extend((key, str(item)) for item in values)
+    return query
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        # Callers queue on the lock, so tokens are handed out in FIFO order
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot take {tokens} tokens from a bucket of {self.capacity}")
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class AsyncWeatherFetcher:
+    # Open-Meteo counts every location in a request as one call, so the
+    # bucket is charged per location: ``rate`` locations per second, at
+    # most ``burst`` at once. The defaults stay inside the free tier of 600
+    # calls per minute
+    def __init__(
+            self,
+            url=FORECAST_URL,
+            concurrency=8,
+            rate=10,
+            burst=MAX_LOCATIONS_PER_REQUEST,
+            timeout=30,
+            retries=5,
+            backoff_factor=0.2,
+            max_locations=MAX_LOCATIONS_PER_REQUEST,
+            max_url_length=MAX_URL_LENGTH):
+        self.url = url
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        # A chunk must fit in the bucket to ever be sent
+        self.max_locations = min(max_locations, burst)
+        self.max_url_length = max_url_length
+        self._bucket = TokenBucket(rate, burst)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._session = None
+
+    async def _request(self, params, locations=1):
+        query = _query(params)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff_factor * 2 ** (attempt - 1))
+            await self._bucket.acquire(locations)
+            try:
+                async with self._semaphore, self._session.get(self.url, params=query) as response:
+                    if response.status in RETRY_STATUSES and attempt < self.retries:
+                        continue
+                    if response.status in (400, 429):
+                        raise OpenMeteoRequestsError(await response.json(content_type=None))
+                    response.raise_for_status()
+                    return decode_responses(await response.read())
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+
+    async def _fetch_chunk(self, chunk):
+        latitudes, longitudes = zip(*chunk)
+        responses = await self._request(forecast_params(latitudes, longitudes), len(chunk))
+        if len(responses) != len(chunk):
+            raise ValueError(f"Expected {len(chunk)} responses, got {len(responses)}")
+        return responses
+
+    async def fetch_many(self, coordinates):
+        chunks = list(chunk_coordinates(coordinates, self.max_locations, self.max_url_length))
+        results = await asyncio.gather(*(self._fetch_chunk(chunk) for chunk in chunks))
+        return [response for chunk_responses in results for response in chunk_responses]
+
+    async def fetch(self, latitude, longitude):
+        return (await self._fetch_chunk([(latitude, longitude)]))[0]
+
+
+class ThreadedFetcher:
+    # An AsyncWeatherFetcher on an event loop of its own, for synchronous
+    # callers such as the refresh pipeline's fetch workers. Every caller
+    # shares its rate limit and connection pool. Requests go straight to
+    # the API: the HTTP cache and the model-run expiry of WeatherClient
+    # are not involved
+    def __init__(self, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-fetch", daemon=True)
+        self._thread.start()
+        self._fetcher = self._call(self._open(kwargs))
+
+    async def _open(self, kwargs):
+        return await AsyncWeatherFetcher(**kwargs).__aenter__()
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def fetch_many(self, coordinates):
+        return self._call(self._fetcher.fetch_many(list(coordinates)))
+
+    def close(self):
+        self._call(self._fetcher.__aexit__(None, None, None))
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def fetch_weather_data_async(coordinates, **kwargs):
+    # Synchronous entry point for scripts that are not already in a loop
+    async def run():
+        async with AsyncWeatherFetcher(**kwargs) as fetcher:
+            return await fetcher.fetch_many(coordinates)
+    return asyncio.run(run())
@@ -0,0 +1,71 @@
+import bisect
+import threading
+
+import numpy as np
+
+from city_index import get_city_index, normalize_name
+
+
+class Autocomplete:
+    def __init__(self, city_index):
+        gazetteer = city_index.gazetteer
+        cities = gazetteer.column("city")
+        population = np.nan_to_num(np.asarray(gazetteer.population), nan=-1.0)
+
+        # One entry per normalized name, shown as (and ranked by) its most
+        # populous city; keys are kept sorted so a prefix maps to a slice
+        entries = sorted(city_index.items())
+        self._keys = [key for key, _ in entries]
+        top_rows = [rows[0] for _, rows in entries]
+        self._display = [cities[row] for row in top_rows]
+        self._population = population[top_rows]
+
+        self._last_key = None
+        self._last_range = (0, len(self._keys))
+
+    def _prefix_range(self, key):
+        lo, hi = 0, len(self._keys)
+        # Typing one more character can only shrink the previous range
+        if self._last_key is not None and key.startswith(self._last_key):
+            lo, hi = self._last_range
+        lo = bisect.bisect_left(self._keys, key, lo, hi)
+        hi = bisect.bisect_left(self._keys, key + "\U0010ffff", lo, hi)
+        self._last_key = key
+        self._last_range = (lo, hi)
+        return lo, hi
+
+    def complete(self, prefix, k=5):
+        lo, hi = self._prefix_range(normalize_name(prefix))
+        if lo == hi:
+            return []
+
+        population = self._population[lo:hi]
+        # Over-fetch a little: city and city_ascii keys can share a display name
+        limit = min(2 * k, hi - lo)
+        if limit < hi - lo:
+            best = np.argpartition(-population, limit - 1)[:limit]
+        else:
+            best = np.arange(hi - lo)
+        best = best[np.argsort(-population[best], kind="stable")]
+
+        suggestions = []
+        for offset in best.tolist():
+            name = self._display[lo + offset]
+            if name not in suggestions:
+                suggestions.append(name)
+                if len(suggestions) == k:
+                    break
+        return suggestions
+
+
+_autocomplete = None
+_autocomplete_lock = threading.Lock()
+
+
+def get_autocomplete():
+    global _autocomplete
+    if _autocomplete is None:
+        with _autocomplete_lock:
+            if _autocomplete is None:
+                _autocomplete = Autocomplete(get_city_index())
+    return _autocomplete
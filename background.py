@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundRunner:
+    # Runs slow work on a thread pool and hands results back to Tk. Widgets
+    # are only touched from the main thread: finished futures are picked up
+    # by polling with root.after instead of calling back from the worker
+    def __init__(self, root, max_workers=2, poll_ms=50, on_busy=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_busy = on_busy
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="weather")
+        self._pending = []
+        self._cancelled = threading.Event()
+        self._polling = False
+
+    def cancel(self):
+        # Queued tasks are dropped; running ones see their event set and
+        # their results are discarded when they finish
+        self._cancelled.set()
+        for _, future, _, _ in self._pending:
+            future.cancel()
+        self._pending = []
+        self._cancelled = threading.Event()
+
+    def submit(self, task, on_done, on_error=None, replace=True):
+        # ``task`` receives a threading.Event it may check between stages
+        if replace:
+            self.cancel()
+        cancelled = self._cancelled
+        future = self._executor.submit(task, cancelled)
+        self._pending.append((cancelled, future, on_done, on_error))
+        if not self._polling:
+            self._polling = True
+            if self.on_busy:
+                self.on_busy(True)
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        finished, self._pending = self._pending, []
+        still_running = []
+        for cancelled, future, on_done, on_error in finished:
+            if not future.done():
+                still_running.append((cancelled, future, on_done, on_error))
+            elif cancelled.is_set() or future.cancelled():
+                continue
+            elif future.exception() is not None:
+                if on_error:
+                    on_error(future.exception())
+                else:
+                    print(f"Background task failed: {future.exception()}")
+            else:
+                on_done(future.result())
+        # Callbacks may have submitted follow-up work in the meantime
+        self._pending = still_running + self._pending
+
+        if self._pending:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
+            if self.on_busy:
+                self.on_busy(False)
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
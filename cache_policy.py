@@ -0,0 +1,96 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+# Every weather model publishes when its latest run became available and how
+# often new runs are made. The file is tiny and served with validators, so
+# checking it is a conditional request that is usually answered with a 304
+META_URL = "https://api.open-meteo.com/data/{model}/static/meta.json"
+META_URL_PATTERN = "api.open-meteo.com/data/*/static/meta.json"
+META_URL_PREFIX = "https://api.open-meteo.com/data/"
+
+# The default "best match" forecast blends these global models; a new run of
+# any of them can change the data we have cached
+DEFAULT_MODELS = ("dwd_icon", "ncep_gfs013", "ecmwf_ifs025")
+
+
+class ForecastCyclePolicy:
+    # Cached forecasts stay valid until the next model run is expected to be
+    # available, and are dropped as soon as a newer run has landed. Without
+    # model metadata (offline, endpoint down) runs are assumed to land on
+    # every ``fallback_interval`` boundary, which matches the old fixed hour
+    def __init__(
+            self,
+            models=DEFAULT_MODELS,
+            fallback_interval=3600,
+            check_interval=600,
+            late_retry=600,
+            timeout=2,
+            clock=time.time):
+        self.models = tuple(models)
+        self.fallback_interval = fallback_interval
+        self.check_interval = check_interval
+        self.late_retry = late_retry
+        self.timeout = timeout
+        self.clock = clock
+        self._runs = {}
+        self._expires = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def _fallback_expiry(self, now):
+        return (now // self.fallback_interval + 1) * self.fallback_interval
+
+    def _next_run(self, meta, now):
+        next_run = meta["last_run_availability_time"] + meta["update_interval_seconds"]
+        # A run that is overdue is polled for again shortly instead of
+        # treating everything as expired until it shows up
+        return next_run if next_run > now else now + self.late_retry
+
+    def expires_at(self, now=None):
+        now = self.clock() if now is None else now
+        with self._lock:
+            expires = self._expires
+        if expires is None or expires <= now:
+            return self._fallback_expiry(now)
+        return expires
+
+    def expire_after(self, now=None):
+        return datetime.fromtimestamp(self.expires_at(now), tz=timezone.utc)
+
+    def latest_run(self):
+        # Availability time of the newest run across all models, or None
+        with self._lock:
+            return max(self._runs.values(), default=None)
+
+    def refresh(self, session=None, force=False):
+        # Re-reads model metadata at most every ``check_interval`` seconds.
+        # Returns the availability time of a newly landed run, or None
+        now = self.clock()
+        with self._lock:
+            if not force and self._checked is not None and now - self._checked < self.check_interval:
+                return None
+            self._checked = now
+        get = (session or requests).get
+
+        runs, expiries = {}, []
+        for model in self.models:
+            try:
+                response = get(META_URL.format(model=model), timeout=self.timeout)
+                response.raise_for_status()
+                meta = response.json()
+                runs[model] = meta["last_run_availability_time"]
+                expiries.append(self._next_run(meta, now))
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print(f"Model metadata for {model} unavailable: {e}")
+
+        with self._lock:
+            previous = max(self._runs.values(), default=None)
+            self._runs.update(runs)
+            self._expires = min(expiries) if expiries else None
+            latest = max(self._runs.values(), default=None)
+        if latest is not None and latest != previous:
+            return latest
+        return None
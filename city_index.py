@@ -0,0 +1,114 @@
+import threading
+import unicodedata
+
+import numpy as np
+
+from gazetteer import get_gazetteer
+
+
+def normalize_name(name):
+    # Casefold and strip accents so "São Paulo", "sao paulo" and "SAO PAULO" collide
+    name = str(name)
+    if name.isascii():
+        return " ".join(name.casefold().split())
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+class CityIndex:
+    def __init__(self, gazetteer):
+        self.gazetteer = gazetteer
+        population = np.nan_to_num(np.asarray(gazetteer.population), nan=-1.0)
+
+        # Visit rows from most to least populous so every candidate tuple is
+        # already ranked and the first entry is the sensible default
+        order = np.argsort(-population, kind="stable").tolist()
+        cities = gazetteer.column("city")
+        ascii_names = gazetteer.column("city_ascii")
+        rows_by_name = {}
+        for row in order:
+            city_key = normalize_name(cities[row])
+            rows_by_name.setdefault(city_key, []).append(row)
+            ascii_key = normalize_name(ascii_names[row])
+            if ascii_key and ascii_key != city_key:
+                rows_by_name.setdefault(ascii_key, []).append(row)
+        self._rows = {key: tuple(rows) for key, rows in rows_by_name.items()}
+
+    def __contains__(self, name):
+        return normalize_name(name) in self._rows
+
+    def items(self):
+        # (normalized name, ranked rows) pairs, for building secondary indexes
+        return self._rows.items()
+
+    def lookup(self, name):
+        return self._rows.get(normalize_name(name), ())
+
+    def resolve(self, city, admin_name=None, country=None):
+        # Narrow the (few) same-named candidates by region and country;
+        # country matches the full name or either ISO code
+        gazetteer = self.gazetteer
+        admin_key = normalize_name(admin_name) if admin_name else None
+        country_key = normalize_name(country) if country else None
+        for row in self.lookup(city):
+            if admin_key and normalize_name(gazetteer.value("admin_name", row)) != admin_key:
+                continue
+            if country_key and country_key not in (
+                normalize_name(gazetteer.value("country", row)),
+                normalize_name(gazetteer.value("iso2", row)),
+                normalize_name(gazetteer.value("iso3", row)),
+            ):
+                continue
+            return row
+        return None
+
+    def resolve_label(self, label):
+        # Accepts "City", "City, Country" or "City, Region, Country". Region
+        # and country names can contain commas themselves ("London, City of",
+        # "Korea, South"), so every split of the rest is tried
+        parts = [part.strip() for part in label.split(",")]
+        if len(parts) == 1:
+            rows = self.lookup(parts[0])
+            return rows[0] if rows else None
+        rest = parts[1:]
+        splits = [(", ".join(rest[:i]), ", ".join(rest[i:])) for i in range(1, len(rest))]
+        splits.append((None, ", ".join(rest)))
+        if len(rest) == 1:
+            splits.append((rest[0], None))
+        for admin_name, country in splits:
+            row = self.resolve(parts[0], admin_name=admin_name, country=country)
+            if row is not None:
+                return row
+        return None
+
+    def label(self, row):
+        gazetteer = self.gazetteer
+        parts = [
+            gazetteer.value("city", row),
+            gazetteer.value("admin_name", row),
+            gazetteer.value("country", row),
+        ]
+        return ", ".join(part for part in parts if part)
+
+    def canonical_name(self, label):
+        # Every spelling that finds a row ("paris", "Paris, France") maps to
+        # that row's full label, so it is stored and read under one name
+        row = self.resolve_label(label)
+        return None if row is None else self.label(row)
+
+    def candidates(self, name):
+        return [self.label(row) for row in self.lookup(name)]
+
+
+_city_index = None
+_city_index_lock = threading.Lock()
+
+
+def get_city_index():
+    global _city_index
+    if _city_index is None:
+        with _city_index_lock:
+            if _city_index is None:
+                _city_index = CityIndex(get_gazetteer())
+    return _city_index
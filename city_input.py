@@ -1,14 +1,13 @@
-import pandas as pd
+from gazetteer import get_gazetteer
+from city_index import get_city_index
 
 def get_city_coordinates(city_name):
-    # Load city coordinates from Excel file
+    # Look up city coordinates in the compiled gazetteer
     try:
-        city_data = pd.read_excel("worldcities\worldcities.xlsx")
-        city_info = city_data[city_data['city'] == city_name]
-        if not city_info.empty:
-            latitude = city_info.iloc[0]['lat']
-            longitude = city_info.iloc[0]['lng']
-            return latitude, longitude
+        city_index = get_city_index()
+        row = city_index.resolve_label(city_name)
+        if row is not None:
+            return city_index.gazetteer.coordinates(row)
         else:
             print("City not found in database.")
             return None, None
@@ -16,7 +15,21 @@ def get_city_coordinates(city_name):
         print("City coordinates file not found.")
         return None, None
 
-# Function to fetch city names from the file
+def resolve_city(city_name):
+    # (canonical name, latitude, longitude); the name is the full label of
+    # the gazetteer row, the key locations are stored under
+    try:
+        city_index = get_city_index()
+        row = city_index.resolve_label(city_name)
+        if row is not None:
+            return (city_index.label(row),) + tuple(city_index.gazetteer.coordinates(row))
+        else:
+            print("City not found in database.")
+            return None, None, None
+    except FileNotFoundError:
+        print("City coordinates file not found.")
+        return None, None, None
+
+# Function to fetch city names from the gazetteer
 def get_all_city_names():
-    df = pd.read_excel("worldcities\worldcities.xlsx")
-    return df['city'].tolist()
\ No newline at end of file
+    return get_gazetteer().city_names()
\ No newline at end of file
@@ -0,0 +1,127 @@
+import numpy as np
+from matplotlib import dates as mdates
+from matplotlib.figure import Figure
+
+from downsample import LevelOfDetail
+
+DAY = 1.0  # matplotlib date units are days
+
+# (column, title, y label, y step, fixed y range)
+PANELS = [
+    ("temperature_2m", "Hourly Temperature Variation", "Temperature (°C)", 5, None),
+    ("relative_humidity_2m", "Hourly Humidity Variation", "Relative Humidity (%)", 10, (0, 100)),
+    ("precipitation", "Hourly Precipitation Variation", "Precipitation (mm)", 1, None),
+    ("rain", "Hourly Rain Variation", "Rain (mm)", 1, None),
+    ("cloud_cover", "Hourly Cloud Cover Variation", "Cloud Cover (%)", 10, (0, 100)),
+]
+
+
+def _snap(low, high, step):
+    # Limits rounded outward to whole steps, so similar data (another city,
+    # the next refresh) usually keeps the same axes and needs no full redraw
+    if not np.isfinite(low) or not np.isfinite(high):
+        return 0, step
+    low, high = np.floor(low / step) * step, np.ceil(high / step) * step
+    return (low, high + step) if low == high else (low, high)
+
+
+def get_color_gradient(time_of_day):
+    if 6 <= time_of_day < 12:
+        plot_color = "whitesmoke"
+        fg_color = "deepskyblue"
+        bg_color = "deepskyblue"
+    elif 12 <= time_of_day < 18:
+        plot_color = "bisque"
+        fg_color = "coral"
+        bg_color = "coral"
+    elif 18 <= time_of_day < 20:
+        plot_color = "lightpink"
+        fg_color = "slateblue"
+        bg_color = "slateblue"
+    else:
+        plot_color = "royalblue"
+        fg_color = "black"
+        bg_color = "black"
+    return plot_color, fg_color, bg_color
+
+
+class DashboardFigure:
+    # The hourly 3x2 dashboard, built once. New data only moves the Line2D
+    # artists and, when the snapped limits change, the axes. No GUI toolkit
+    # is involved, so it can also be rendered off screen
+    def __init__(self, figsize=(12, 8), animated=False):
+        self.figure = Figure(figsize=figsize)
+        grid = self.figure.subplots(3, 2)
+        self.axes = {}
+        self.lines = {}
+        self.details = {}
+        self._panels = {}
+        for (column, title, ylabel, step, fixed), ax in zip(PANELS, grid.flat):
+            line, = ax.plot([], [], marker="o", linestyle="-", animated=animated)
+            ax.set_title(title)
+            ax.set_xlabel("Date")
+            ax.set_ylabel(ylabel)
+            ax.xaxis_date()
+            ax.tick_params(axis="x", rotation=45)
+            ax.grid(True)
+            self.axes[column] = ax
+            self.lines[column] = line
+            self.details[column] = LevelOfDetail(line)
+            self._panels[ax] = (column, title, step, fixed)
+        grid[2, 1].axis("off")
+        self.colors = None
+        self._laid_out = False
+
+    def set_colors(self, plot_color, fg_color, bg_color):
+        # Returns True if anything changed (the static background must be redrawn)
+        colors = (plot_color, fg_color, bg_color)
+        if colors == self.colors:
+            return False
+        self.colors = colors
+        self.figure.patch.set_facecolor(bg_color)
+        for ax in self.axes.values():
+            ax.set_facecolor(fg_color)
+            ax.title.set_color(plot_color)
+            ax.xaxis.label.set_color(plot_color)
+            ax.yaxis.label.set_color(plot_color)
+            ax.tick_params(axis="both", colors=plot_color)
+            ax.grid(True, color=plot_color)
+        for line in self.lines.values():
+            line.set_color(plot_color)
+        return True
+
+    def set_data(self, dates, columns):
+        # ``columns`` maps column name -> values. Returns True if any axis
+        # limits changed, i.e. blitting the lines alone is not enough
+        x = mdates.date2num(dates)
+        xlim = (np.floor(x.min()), np.ceil(x.max()) + DAY) if len(x) else (0, DAY)
+        rescaled = False
+        for ax, (column, _, step, fixed) in self._panels.items():
+            y = np.asarray(columns[column], dtype=np.float64)
+            self.details[column].set_data(x, y, update=False)
+            ylim = fixed or _snap(np.nanmin(y) if len(y) else np.nan, np.nanmax(y) if len(y) else np.nan, step)
+            if tuple(ax.get_xlim()) != tuple(xlim) or tuple(ax.get_ylim()) != tuple(ylim):
+                # Setting the x limits also re-downsamples the line
+                ax.set_xlim(xlim)
+                ax.set_ylim(ylim)
+                rescaled = True
+            else:
+                self.details[column].update()
+        if not self._laid_out:
+            self.figure.tight_layout()
+            self._laid_out = True
+            for detail in self.details.values():
+                detail.update()
+        return rescaled
+
+    def set_dataframe(self, hourly_dataframe):
+        return self.set_data(hourly_dataframe["date"], hourly_dataframe)
+
+    def panel_at(self, event):
+        # (column, title) of the panel under a mouse event, or None
+        panel = self._panels.get(event.inaxes)
+        return (panel[0], panel[1]) if panel else None
+
+    def draw_lines(self):
+        for column, line in self.lines.items():
+            self.axes[column].draw_artist(line)
@@ -1,9 +1,263 @@
+import threading
+import time
+
+import pandas as pd
 import sqlalchemy as db
 
+from city_index import get_city_index
+from online_stats import create_online_schema, observe
+from rollups import create_rollup_schema, rebuild_rollups, take_changes, track_changes, update_rollups
+
+DATABASE_URL = "sqlite:///weather_data.db"
+
+# Applied to every new pooled connection. WAL lets readers run alongside a
+# writer and, with synchronous=NORMAL, commits no longer fsync the database
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+HOURLY_COLUMNS = ["temperature_2m", "relative_humidity_2m", "precipitation", "rain", "cloud_cover"]
+DAILY_COLUMNS = ["uv_index_max"]
+
+# One row per location and UTC hour (or day), timestamps as integer epoch
+# seconds. The primary key is the clustered index, so lookups by city and
+# time range read a single contiguous run of rows
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS locations (
+        location_id INTEGER PRIMARY KEY,
+        city_name TEXT NOT NULL UNIQUE,
+        timezone TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS hourly (
+        location_id INTEGER NOT NULL REFERENCES locations (location_id),
+        time INTEGER NOT NULL,
+        temperature_2m REAL,
+        relative_humidity_2m REAL,
+        precipitation REAL,
+        rain REAL,
+        cloud_cover REAL,
+        PRIMARY KEY (location_id, time)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS daily (
+        location_id INTEGER NOT NULL REFERENCES locations (location_id),
+        time INTEGER NOT NULL,
+        uv_index_max REAL,
+        PRIMARY KEY (location_id, time)
+    ) WITHOUT ROWID""",
+]
+
+# Tables written by the old DataFrame.to_sql(if_exists="append") code
+LEGACY_TABLES = {"hourly_data": ("hourly", HOURLY_COLUMNS), "daily_data": ("daily", DAILY_COLUMNS)}
+
+
+def upsert_sql(table, columns):
+    # Rows that are already stored with the same values are left untouched,
+    # so re-fetching the overlapping past days writes nothing
+    names = ["location_id", "time"] + columns
+    assignments = ", ".join(f"{column} = excluded.{column}" for column in columns)
+    changed = " OR ".join(f"{column} IS NOT excluded.{column}" for column in columns)
+    return (
+        f"INSERT INTO {table} ({', '.join(names)}) "
+        f"VALUES ({', '.join('?' for _ in names)}) "
+        f"ON CONFLICT (location_id, time) DO UPDATE SET {assignments} WHERE {changed}")
+
+
+def create_schema(connection):
+    for statement in SCHEMA:
+        connection.exec_driver_sql(statement)
+    columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(locations)")}
+    if "timezone" not in columns:
+        connection.exec_driver_sql("ALTER TABLE locations ADD COLUMN timezone TEXT")
+    migrate_legacy(connection)
+    if create_rollup_schema(connection):
+        for table, columns in (("hourly", HOURLY_COLUMNS), ("daily", DAILY_COLUMNS)):
+            rebuild_rollups(connection, table, columns)
+    create_online_schema(connection)
+
+
+def canonical_names(city_names):
+    # {name: canonical name}; names the gazetteer does not know are kept
+    try:
+        city_index = get_city_index()
+    except FileNotFoundError:
+        return {name: name for name in city_names}
+    return {name: (city_index.canonical_name(name) if name else None) or name for name in city_names}
+
+
+def migrate_legacy(connection):
+    # One-time move of the append-only tables into the keyed ones. The old
+    # rows carry whatever the user typed, so spellings of one city are
+    # merged under its canonical name first. Duplicate (city, hour) rows
+    # collapse to the most recently inserted one; rows stored before city
+    # names were recorded are kept under ""
+    existing = set(db.inspect(connection).get_table_names())
+    legacy = [name for name in LEGACY_TABLES if name in existing]
+    for name in legacy:
+        typed = [row[0] for row in connection.exec_driver_sql(
+            f"SELECT DISTINCT COALESCE(city_name, '') FROM {name}")]
+        connection.exec_driver_sql(
+            "CREATE TEMP TABLE legacy_names (typed TEXT PRIMARY KEY, city_name TEXT NOT NULL)")
+        if typed:
+            connection.exec_driver_sql("INSERT INTO legacy_names VALUES (?, ?)", list(canonical_names(typed).items()))
+        connection.exec_driver_sql(
+            "INSERT INTO locations (city_name) SELECT DISTINCT city_name FROM legacy_names WHERE true "
+            "ON CONFLICT (city_name) DO NOTHING")
+        table, columns = LEGACY_TABLES[name]
+        assignments = ", ".join(f"{column} = excluded.{column}" for column in columns)
+        connection.exec_driver_sql(
+            f"INSERT INTO {table} (location_id, time, {', '.join(columns)}) "
+            f"SELECT l.location_id, CAST(strftime('%s', d.Date) AS INTEGER), "
+            f"{', '.join('d.' + column for column in columns)} "
+            f"FROM {name} d JOIN legacy_names n ON n.typed = COALESCE(d.city_name, '') "
+            f"JOIN locations l ON l.city_name = n.city_name "
+            f"WHERE d.Date IS NOT NULL ORDER BY d.rowid "
+            f"ON CONFLICT (location_id, time) DO UPDATE SET {assignments}")
+        connection.exec_driver_sql("DROP TABLE legacy_names")
+        connection.exec_driver_sql(f"DROP TABLE {name}")
+    return legacy
+
+
+def location_ids(connection, city_names):
+    # Callers pass canonical names (city_input.resolve_city), so every
+    # spelling of a city shares one location
+    city_names = sorted(set(city_names))
+    connection.exec_driver_sql(
+        "INSERT INTO locations (city_name) VALUES (?) ON CONFLICT (city_name) DO NOTHING",
+        [(name,) for name in city_names])
+    wanted = set(city_names)
+    return {
+        name: location_id
+        for location_id, name in connection.exec_driver_sql("SELECT location_id, city_name FROM locations")
+        if name in wanted}
+
+
+def epoch_seconds(dates):
+    dates = pd.to_datetime(dates, utc=True)
+    return ((dates - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)).tolist()
+
+
+def _set_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def create_database_engine(url=None, pool_size=5):
+    engine = db.create_engine(
+        url or DATABASE_URL,
+        pool_size=pool_size,
+        connect_args={"check_same_thread": False})
+    db.event.listen(engine, "connect", _set_pragmas)
+    with engine.begin() as connection:
+        create_schema(connection)
+    return engine
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_database_engine()
+    return _engine
+
+
+def _frame_rows(columns, dataframe, ids):
+    return list(zip(
+        dataframe["city_name"].fillna("").map(ids).tolist(),
+        epoch_seconds(dataframe["date"]),
+        *(dataframe[column].astype(float).tolist() for column in columns)))
+
+
+def store_frames(hourly_frames=(), daily_frames=(), engine=None, timezones=None):
+    # Everything is written in one transaction with one executemany per
+    # table, so a refresh of many cities pays for a single commit.
+    # ``timezones`` ({city: IANA name}) is kept on the locations rows so
+    # stored data can be shown in the city's local time later
+    start = time.perf_counter()
+    hourly = pd.concat(hourly_frames, ignore_index=True) if len(hourly_frames) else None
+    daily = pd.concat(daily_frames, ignore_index=True) if len(daily_frames) else None
+    rows = changed = 0
+    with (engine or get_engine()).begin() as connection:
+        names = pd.concat([frame["city_name"] for frame in (hourly, daily) if frame is not None])
+        ids = location_ids(connection, names.fillna(""))
+        if timezones:
+            connection.exec_driver_sql(
+                "UPDATE locations SET timezone = ? WHERE city_name = ? AND timezone IS NOT ?",
+                [(timezone, city_name, timezone) for city_name, timezone in timezones.items()])
+        raw = connection.connection.driver_connection
+        for table, columns, frame in (("hourly", HOURLY_COLUMNS, hourly), ("daily", DAILY_COLUMNS, daily)):
+            if frame is None or frame.empty:
+                continue
+            table_rows = _frame_rows(columns, frame, ids)
+            track_changes(connection, table)
+            before = raw.total_changes
+            connection.exec_driver_sql(upsert_sql(table, columns), table_rows)
+            # total_changes also counts the trigger writes; take_changes has
+            # the real number of written rows
+            changes = take_changes(connection, table) if raw.total_changes != before else {}
+            table_changed = sum(len(times) for times in changes.values())
+            if table_changed:
+                # Rollups over the changed buckets are refreshed in the same
+                # transaction, so they never disagree with the raw rows
+                update_rollups(connection, table, columns, changes)
+            rows += len(frame)
+            changed += table_changed
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "changed": changed,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+    }
+
+
+def store_forecast(hourly_dataframe, daily_dataframe, timezone=None):
+    timezones = {hourly_dataframe["city_name"].iloc[0]: timezone} if timezone and len(hourly_dataframe) else None
+    return store_frames([hourly_dataframe], [daily_dataframe], timezones=timezones)
+
+
+def store_forecasts(forecasts):
+    # ``forecasts`` is an iterable of (hourly_dataframe, daily_dataframe)
+    # or (hourly_dataframe, daily_dataframe, timezone)
+    hourly_frames, daily_frames, timezones = [], [], {}
+    for hourly_dataframe, daily_dataframe, *timezone in forecasts:
+        hourly_frames.append(hourly_dataframe)
+        daily_frames.append(daily_dataframe)
+        if timezone and timezone[0] and len(hourly_dataframe):
+            timezones[hourly_dataframe["city_name"].iloc[0]] = timezone[0]
+    return store_frames(hourly_frames, daily_frames, timezones=timezones)
+
+
+def record_observations(hourly_frames, until=None, engine=None):
+    # Feeds hours up to ``until`` (default: now, so forecast hours are left
+    # out) into the running per-city statistics, in one transaction
+    until = epoch_seconds([pd.Timestamp.now(tz="UTC") if until is None else until])[0]
+    hourly = pd.concat(hourly_frames, ignore_index=True)
+    with (engine or get_engine()).begin() as connection:
+        ids = location_ids(connection, hourly["city_name"].fillna(""))
+        updated = 0
+        for city_name, frame in hourly.groupby(hourly["city_name"].fillna(""), sort=False):
+            frame = frame.sort_values("date")
+            times = pd.Series(epoch_seconds(frame["date"]))
+            past = (times <= until).to_numpy()
+            updated += observe(
+                connection, ids[city_name], times[past], frame[HOURLY_COLUMNS].to_numpy()[past], HOURLY_COLUMNS)
+    return updated
+
+
 def store_hourly_data(hourly_dataframe):
-    engine = db.create_engine('sqlite:///weather_data.db')
-    hourly_dataframe.to_sql('hourly_data', con=engine, if_exists='append', index=False)
+    return store_frames(hourly_frames=[hourly_dataframe])["changed"]
+
 
 def store_daily_data(daily_dataframe):
-    engine = db.create_engine('sqlite:///weather_data.db')
-    daily_dataframe.to_sql('daily_data', con=engine, if_exists='append', index=False)
+    return store_frames(daily_frames=[daily_dataframe])["changed"]
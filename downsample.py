@@ -0,0 +1,108 @@
+import numpy as np
+from matplotlib import dates as mdates
+
+POINTS_PER_PIXEL = 1
+
+
+def _gap_indices(y):
+    # First NaN of every run, kept so gaps in the data stay gaps in the line
+    missing = np.isnan(y)
+    return np.flatnonzero(missing & ~np.concatenate([[False], missing[:-1]]))
+
+
+def minmax_indices(x, y, buckets):
+    # The lowest and highest point of each of ``buckets`` equal slices of
+    # the x range. Extremes are exact, so peaks survive any zoom level
+    finite = np.flatnonzero(~np.isnan(y))
+    if len(finite) <= 2 * buckets:
+        return np.arange(len(x))
+    xf = x[finite]
+    span = xf[-1] - xf[0] or 1
+    bucket = np.minimum(((xf - xf[0]) * (buckets / span)).astype(np.int64), buckets - 1)
+    order = np.lexsort((y[finite], bucket))
+    grouped = bucket[order]
+    starts = np.flatnonzero(np.concatenate([[True], grouped[1:] != grouped[:-1]]))
+    ends = np.append(starts[1:], len(order)) - 1
+    keep = finite[np.concatenate([order[starts], order[ends], [0, len(finite) - 1]])]
+    return np.unique(np.concatenate([keep, _gap_indices(y)]))
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: from each bucket keep the point that
+    # spans the largest triangle with the previously kept point and the
+    # average of the next bucket. Smoother than min/max, one Python step
+    # per bucket
+    finite = np.flatnonzero(~np.isnan(y))
+    n = len(finite)
+    if threshold < 3 or n <= threshold:
+        return np.arange(len(x))
+    xf, yf = x[finite], y[finite]
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    edges = np.append(edges, n)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        low, high, after = edges[i], edges[i + 1], edges[i + 2]
+        average_x, average_y = xf[high:after].mean(), yf[high:after].mean()
+        area = np.abs(
+            (xf[a] - average_x) * (yf[low:high] - yf[a])
+            - (xf[a] - xf[low:high]) * (average_y - yf[a]))
+        a = low + int(area.argmax())
+        selected[i + 1] = a
+    return np.unique(np.concatenate([finite[selected], _gap_indices(y)]))
+
+
+METHODS = {
+    "minmax": minmax_indices,
+    "lttb": lttb_indices,
+}
+
+
+class LevelOfDetail:
+    # Keeps the full series for a Line2D and gives the line only what the
+    # axes can show: the points inside the current x limits, reduced to
+    # about one bucket per pixel. Zooming or panning re-runs the reduction
+    # through the axes' xlim_changed callback. Markers are drawn only while
+    # every point is shown; on a reduced line they would just be a smear
+    def __init__(self, line, method="minmax", points_per_pixel=POINTS_PER_PIXEL):
+        self.line = line
+        self.axes = line.axes
+        self.method = METHODS[method]
+        self.points_per_pixel = points_per_pixel
+        self.marker = line.get_marker()
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        # A plain function is held strongly by the callback registry, a bound
+        # method would not be
+        self.axes.callbacks.connect("xlim_changed", lambda axes: self.update())
+
+    def set_data(self, x, y, update=True):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        order = np.argsort(x, kind="stable")
+        self.x, self.y = x[order], y[order]
+        if update:
+            self.update()
+
+    def update(self):
+        low, high = self.axes.get_xlim()
+        # One point beyond each edge, so the line runs off the axes
+        start = max(int(np.searchsorted(self.x, low, "left")) - 1, 0)
+        end = min(int(np.searchsorted(self.x, high, "right")) + 1, len(self.x))
+        x, y = self.x[start:end], self.y[start:end]
+        buckets = max(int(self.axes.bbox.width * self.points_per_pixel), 3)
+        indices = self.method(x, y, buckets)
+        self.line.set_data(x[indices], y[indices])
+        self.line.set_marker(self.marker if len(indices) == len(x) else "None")
+        return len(indices)
+
+
+def plot_downsampled(ax, dates, values, method="minmax", **style):
+    # ax.plot for a date series, with a LevelOfDetail attached to the line
+    x = mdates.date2num(dates)
+    line, = ax.plot(x, np.asarray(values, dtype=np.float64), **style)
+    ax.xaxis_date()
+    detail = LevelOfDetail(line, method)
+    detail.set_data(x, values)
+    return line, detail
@@ -0,0 +1,140 @@
+import sys
+
+import numpy as np
+import pandas as pd
+from openmeteo_sdk.Aggregation import Aggregation
+from openmeteo_sdk.Variable import Variable
+
+from weather_api import DAILY_VARIABLES, HOURLY_VARIABLES
+
+_VARIABLE_NAMES = {
+    value: name for name, value in vars(Variable).items() if not name.startswith("_")}
+_AGGREGATION_SUFFIXES = {
+    Aggregation.minimum: "_min",
+    Aggregation.maximum: "_max",
+    Aggregation.mean: "_mean",
+    Aggregation.sum: "_sum",
+}
+
+
+def variable_name(variable):
+    # Rebuilds the request name, e.g. temperature + 2 m -> "temperature_2m"
+    name = _VARIABLE_NAMES.get(variable.Variable())
+    if name is None:
+        return None
+    if variable.Altitude():
+        name += f"_{variable.Altitude()}m"
+    return name + _AGGREGATION_SUFFIXES.get(variable.Aggregation(), "")
+
+
+def _decode(block, names):
+    # Copies every series into one (variables x steps) float32 array, matched
+    # by name rather than position; a lone series stays a view of the buffer
+    if block is None:
+        return 0, 0, np.empty((len(names), 0), dtype=np.float32)
+    series = {}
+    for i in range(block.VariablesLength()):
+        variable = block.Variables(i)
+        name = variable_name(variable) or (names[i] if i < len(names) else None)
+        series[name] = variable.ValuesAsNumpy()
+    steps = (block.TimeEnd() - block.Time()) // block.Interval()
+    if len(names) == 1 and names[0] in series:
+        values = series[names[0]].reshape(1, -1)
+    else:
+        values = np.full((len(names), steps), np.nan, dtype=np.float32)
+        for row, name in enumerate(names):
+            if name in series:
+                values[row] = series[name]
+    return block.Time(), block.Interval(), values
+
+
+class Forecast:
+    # One location's forecast as two compact arrays (hourly and daily, one
+    # row per variable) with the time axes derived from start and interval.
+    # DataFrames are built only when asked for, and then kept
+    __slots__ = (
+        "city_name", "latitude", "longitude", "elevation", "timezone", "timezone_abbreviation",
+        "hourly_variables", "hourly_start", "hourly_interval", "hourly_values",
+        "daily_variables", "daily_start", "daily_interval", "daily_values",
+        "_hourly_times", "_daily_times", "_hourly_dataframe", "_daily_dataframe")
+
+    def __init__(self, city_name, latitude, longitude, elevation, timezone, timezone_abbreviation,
+                 hourly_variables, hourly_start, hourly_interval, hourly_values,
+                 daily_variables, daily_start, daily_interval, daily_values):
+        self.city_name = sys.intern(city_name)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.elevation = elevation
+        self.timezone = timezone
+        self.timezone_abbreviation = timezone_abbreviation
+        self.hourly_variables = tuple(hourly_variables)
+        self.hourly_start = hourly_start
+        self.hourly_interval = hourly_interval
+        self.hourly_values = hourly_values
+        self.daily_variables = tuple(daily_variables)
+        self.daily_start = daily_start
+        self.daily_interval = daily_interval
+        self.daily_values = daily_values
+        self._hourly_times = None
+        self._daily_times = None
+        self._hourly_dataframe = None
+        self._daily_dataframe = None
+
+    @classmethod
+    def from_response(cls, response, city_name, hourly_variables=HOURLY_VARIABLES, daily_variables=DAILY_VARIABLES):
+        hourly_start, hourly_interval, hourly_values = _decode(response.Hourly(), hourly_variables)
+        daily_start, daily_interval, daily_values = _decode(response.Daily(), daily_variables)
+        timezone = response.Timezone()
+        abbreviation = response.TimezoneAbbreviation()
+        return cls(
+            city_name, response.Latitude(), response.Longitude(), response.Elevation(),
+            timezone.decode() if isinstance(timezone, bytes) else timezone,
+            abbreviation.decode() if isinstance(abbreviation, bytes) else abbreviation,
+            hourly_variables, hourly_start, hourly_interval, hourly_values,
+            daily_variables, daily_start, daily_interval, daily_values)
+
+    def __len__(self):
+        return self.hourly_values.shape[1]
+
+    def __sizeof__(self):
+        size = object.__sizeof__(self) + self.hourly_values.nbytes + self.daily_values.nbytes
+        for frame in (self._hourly_dataframe, self._daily_dataframe):
+            if frame is not None:
+                size += int(frame.memory_usage(deep=True).sum())
+        return size
+
+    @property
+    def hourly_times(self):
+        # int64 epoch seconds, computed on first use
+        if self._hourly_times is None:
+            self._hourly_times = self.hourly_start + self.hourly_interval * np.arange(len(self), dtype=np.int64)
+        return self._hourly_times
+
+    @property
+    def daily_times(self):
+        if self._daily_times is None:
+            self._daily_times = self.daily_start + self.daily_interval * np.arange(
+                self.daily_values.shape[1], dtype=np.int64)
+        return self._daily_times
+
+    def __getitem__(self, key):
+        # A variable's series, or (hours x variables) for a list of names
+        if isinstance(key, str):
+            return self.hourly_values[self.hourly_variables.index(key)]
+        return self.hourly_values[[self.hourly_variables.index(name) for name in key]].T
+
+    def _dataframe(self, times, variables, values):
+        data = {"date": pd.to_datetime(times, unit="s", utc=True), "city_name": self.city_name}
+        for name, row in zip(variables, values):
+            data[name] = row
+        return pd.DataFrame(data)
+
+    def hourly_dataframe(self):
+        if self._hourly_dataframe is None:
+            self._hourly_dataframe = self._dataframe(self.hourly_times, self.hourly_variables, self.hourly_values)
+        return self._hourly_dataframe
+
+    def daily_dataframe(self):
+        if self._daily_dataframe is None:
+            self._daily_dataframe = self._dataframe(self.daily_times, self.daily_variables, self.daily_values)
+        return self._daily_dataframe
@@ -0,0 +1,105 @@
+import threading
+
+import numpy as np
+
+from city_index import get_city_index, normalize_name
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a, b, bound):
+    # Levenshtein distance, giving up as soon as it must exceed ``bound``
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return previous[-1]
+
+
+class FuzzySearch:
+    def __init__(self, city_index, max_candidates=200):
+        gazetteer = city_index.gazetteer
+        cities = gazetteer.column("city")
+        population = np.nan_to_num(np.asarray(gazetteer.population), nan=-1.0)
+        self.max_candidates = max_candidates
+
+        entries = list(city_index.items())
+        self._keys = [key for key, _ in entries]
+        top_rows = [rows[0] for _, rows in entries]
+        self._display = [cities[row] for row in top_rows]
+        self._population = population[top_rows]
+
+        # Inverted index: trigram -> ids of the names containing it
+        postings = {}
+        for key_id, key in enumerate(self._keys):
+            for gram in trigrams(key):
+                postings.setdefault(gram, []).append(key_id)
+        self._postings = {
+            gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()
+        }
+
+    def search(self, name, k=5, max_distance=None):
+        key = normalize_name(name)
+        if not key:
+            return []
+        if max_distance is None:
+            max_distance = min(3, max(1, len(key) // 4))
+
+        grams = trigrams(key)
+        postings = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self._keys))
+
+        # Each edit touches at most three trigrams, so names sharing fewer
+        # than that cannot be within ``max_distance``
+        min_shared = max(1, len(grams) - 3 * max_distance)
+        candidates = np.flatnonzero(shared >= min_shared)
+        if len(candidates) > self.max_candidates:
+            best = np.argpartition(-shared[candidates], self.max_candidates - 1)
+            candidates = candidates[best[:self.max_candidates]]
+
+        matches = []
+        for key_id in candidates.tolist():
+            distance = bounded_edit_distance(key, self._keys[key_id], max_distance)
+            if distance <= max_distance:
+                matches.append((distance, -self._population[key_id], key_id))
+        matches.sort()
+
+        suggestions = []
+        for _, _, key_id in matches:
+            display = self._display[key_id]
+            if display not in suggestions:
+                suggestions.append(display)
+                if len(suggestions) == k:
+                    break
+        return suggestions
+
+
+_fuzzy_search = None
+_fuzzy_search_lock = threading.Lock()
+
+
+def get_fuzzy_search():
+    global _fuzzy_search
+    if _fuzzy_search is None:
+        with _fuzzy_search_lock:
+            if _fuzzy_search is None:
+                _fuzzy_search = FuzzySearch(get_city_index())
+    return _fuzzy_search
+
+
+def suggest_cities(name, k=5):
+    return get_fuzzy_search().search(name, k)
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+WORLDCITIES_PATH = os.path.join(BASE_DIR, "worldcities", "worldcities.xlsx")
+CACHE_DIR = os.path.join(BASE_DIR, "worldcities", ".gazetteer")
+
+# Bump when the on-disk layout changes so stale caches get rebuilt
+FORMAT_VERSION = 1
+
+STRING_COLUMNS = ["city", "city_ascii", "country", "iso2", "iso3", "admin_name"]
+FLOAT_COLUMNS = ["lat", "lng", "population"]
+
+
+class Gazetteer:
+    def __init__(self, floats, columns, strings):
+        self.lat = floats["lat"]
+        self.lng = floats["lng"]
+        self.population = floats["population"]
+        self._columns = columns
+        self._strings = strings
+        self._materialized = {}
+
+    def __len__(self):
+        return len(self.lat)
+
+    def column(self, name):
+        # Row-aligned list of strings, resolved from the interned table once
+        if name not in self._materialized:
+            strings = self._strings
+            self._materialized[name] = [strings[i] for i in self._columns[name].tolist()]
+        return self._materialized[name]
+
+    def value(self, name, row):
+        return self._strings[int(self._columns[name][row])]
+
+    def coordinates(self, row):
+        return float(self.lat[row]), float(self.lng[row])
+
+    def city_names(self):
+        return self.column("city")
+
+
+# Building
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _replace(path, write):
+    # Written under a temporary name and swapped in. Other processes may
+    # have the old file memory-mapped; truncating it in place would crash
+    # them on their next read, a rename leaves their copy intact
+    temporary = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.tmp")
+    with open(temporary, "wb") as f:
+        write(f)
+    os.replace(temporary, path)
+
+
+def _write_meta(cache_dir, meta):
+    _replace(os.path.join(cache_dir, "meta.json"), lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+
+def build_gazetteer(source=WORLDCITIES_PATH, cache_dir=CACHE_DIR):
+    city_data = pd.read_excel(
+        source,
+        usecols=STRING_COLUMNS + FLOAT_COLUMNS,
+        keep_default_na=False,
+        na_values={"population": [""]},
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Intern every string value once; columns store int32 offsets into the table
+    table = {}
+    for name in STRING_COLUMNS:
+        values = city_data[name].astype(str).tolist()
+        indices = np.fromiter(
+            (table.setdefault(value, len(table)) for value in values),
+            dtype=np.int32,
+            count=len(values))
+        _replace(os.path.join(cache_dir, f"{name}.npy"), lambda f: np.save(f, indices))
+    _replace(os.path.join(cache_dir, "strings.bin"), lambda f: f.write("\0".join(table).encode("utf-8")))
+
+    for name in FLOAT_COLUMNS:
+        values = pd.to_numeric(city_data[name], errors="coerce").to_numpy(np.float64)
+        _replace(os.path.join(cache_dir, f"{name}.npy"), lambda f: np.save(f, values))
+
+    # The metadata file is written last so a half-built cache is never trusted
+    _write_meta(cache_dir, {
+        "version": FORMAT_VERSION,
+        "sha256": _file_hash(source),
+        **_source_signature(source),
+    })
+
+
+def _is_fresh(source, cache_dir):
+    meta_path = os.path.join(cache_dir, "meta.json")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    if meta.get("version") != FORMAT_VERSION:
+        return False
+
+    signature = _source_signature(source)
+    if meta.get("mtime_ns") == signature["mtime_ns"] and meta.get("size") == signature["size"]:
+        return True
+
+    # mtime changed (e.g. fresh checkout); only rebuild if the content did too
+    if meta.get("sha256") != _file_hash(source):
+        return False
+    meta.update(signature)
+    _write_meta(cache_dir, meta)
+    return True
+
+
+# Loading
+def load_gazetteer(source=WORLDCITIES_PATH, cache_dir=CACHE_DIR):
+    if not os.path.exists(source):
+        if not os.path.exists(os.path.join(cache_dir, "meta.json")):
+            raise FileNotFoundError(source)
+    elif not _is_fresh(source, cache_dir):
+        build_gazetteer(source, cache_dir)
+
+    floats = {
+        name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+        for name in FLOAT_COLUMNS
+    }
+    columns = {
+        name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+        for name in STRING_COLUMNS
+    }
+    with open(os.path.join(cache_dir, "strings.bin"), "rb") as f:
+        strings = f.read().decode("utf-8").split("\0")
+    return Gazetteer(floats, columns, strings)
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = load_gazetteer()
+    return _gazetteer
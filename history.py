@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+
+from archive import iter_archive
+from database import DAILY_COLUMNS, HOURLY_COLUMNS, get_engine
+from online_stats import load_online_stats
+from rollups import DAY, Aggregate, cover, read_rollups
+
+CHUNK_ROWS = 50000
+TABLE_COLUMNS = {"hourly": HOURLY_COLUMNS, "daily": DAILY_COLUMNS}
+
+
+def to_epoch(value):
+    # None, epoch seconds, datetimes and date strings (naive ones are UTC)
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return int(timestamp.timestamp())
+
+
+def _query(table, columns, start, end):
+    # The (location_id, time) primary key is the table itself (WITHOUT
+    # ROWID), so this is a range scan over one contiguous run of rows that
+    # already holds every column: no extra index lookups, no sort
+    sql = (f"SELECT t.time, {', '.join('t.' + column for column in columns)} "
+           f"FROM {table} t JOIN locations l ON l.location_id = t.location_id "
+           f"WHERE l.city_name = ?")
+    if start is not None:
+        sql += " AND t.time >= ?"
+    if end is not None:
+        sql += " AND t.time < ?"
+    return sql + " ORDER BY t.time"
+
+
+def _frame(rows, city_name, columns):
+    # One float64 array for the whole chunk (NULL becomes NaN), then typed
+    # columns: UTC datetimes from the integer epoch and float32 values
+    values = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns) + 1)
+    data = {
+        "date": pd.to_datetime(values[:, 0].astype(np.int64), unit="s", utc=True),
+        "city_name": city_name,
+    }
+    for i, column in enumerate(columns):
+        data[column] = values[:, i + 1].astype(np.float32)
+    return pd.DataFrame(data)
+
+
+def iter_history(table, city_name, start=None, end=None, columns=None, chunk_rows=CHUNK_ROWS, engine=None):
+    # Yields DataFrames of at most ``chunk_rows`` rows for [start, end).
+    # Archived months come first; SQLite only holds the recent ones
+    columns = list(columns or TABLE_COLUMNS[table])
+    yield from iter_archive(table, city_name, start, end, columns, chunk_rows)
+    params = [city_name] + [to_epoch(bound) for bound in (start, end) if bound is not None]
+    with (engine or get_engine()).connect() as connection:
+        cursor = connection.connection.driver_connection.cursor()
+        try:
+            cursor.execute(_query(table, columns, start, end), params)
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield _frame(rows, city_name, columns)
+        finally:
+            cursor.close()
+
+
+def read_history(table, city_name, start=None, end=None, columns=None, engine=None):
+    columns = list(columns or TABLE_COLUMNS[table])
+    chunks = list(iter_history(table, city_name, start, end, columns, engine=engine))
+    if not chunks:
+        return _frame([], city_name, columns)
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+def read_hourly(city_name, start=None, end=None, columns=None):
+    return read_history("hourly", city_name, start, end, columns)
+
+
+def read_daily(city_name, start=None, end=None, columns=None):
+    return read_history("daily", city_name, start, end, columns)
+
+
+def iter_hourly(city_name, start=None, end=None, chunk_rows=CHUNK_ROWS):
+    return iter_history("hourly", city_name, start, end, chunk_rows=chunk_rows)
+
+
+def stored_cities(engine=None):
+    with (engine or get_engine()).connect() as connection:
+        return [name for (name,) in connection.exec_driver_sql(
+            "SELECT city_name FROM locations ORDER BY city_name")]
+
+
+def city_timezone(city_name, engine=None):
+    # IANA timezone recorded with the city's last stored forecast, or None
+    with (engine or get_engine()).connect() as connection:
+        row = connection.exec_driver_sql(
+            "SELECT timezone FROM locations WHERE city_name = ?", (city_name,)).first()
+    return row[0] if row else None
+
+
+def time_range(city_name, table="hourly", engine=None):
+    # (first, last) epoch seconds stored for a city, or (None, None)
+    with (engine or get_engine()).connect() as connection:
+        return tuple(connection.exec_driver_sql(
+            f"SELECT MIN(t.time), MAX(t.time) FROM {table} t "
+            f"JOIN locations l ON l.location_id = t.location_id WHERE l.city_name = ?",
+            (city_name,)).one())
+
+
+def summarize(city_name, variable, start, end, engine=None):
+    # Statistics of one variable over [start, end) as a merged Aggregate.
+    # Whole days come from the rollup tables (a handful of month, week and
+    # day buckets however long the span); only partial days at either end
+    # are read from the raw rows
+    table = "hourly" if variable in HOURLY_COLUMNS else "daily"
+    start, end = to_epoch(start), to_epoch(end)
+    first_day = -(-start // DAY) * DAY
+    last_day = end // DAY * DAY
+    aggregate = Aggregate()
+    if first_day >= last_day:
+        edges = [(start, end)]
+    else:
+        edges = [(start, first_day), (last_day, end)]
+        with (engine or get_engine()).connect() as connection:
+            location = connection.exec_driver_sql(
+                "SELECT location_id FROM locations WHERE city_name = ?", (city_name,)).first()
+            if location is not None:
+                aggregate.merge(read_rollups(connection, location[0], variable, cover(first_day, last_day)))
+    for edge_start, edge_end in edges:
+        if edge_start < edge_end:
+            frame = read_history(table, city_name, edge_start, edge_end, [variable], engine=engine)
+            aggregate.merge(Aggregate.from_values(frame[variable].to_numpy()))
+    return aggregate
+
+
+def online_report(city_name, variable, engine=None):
+    # Report from the running statistics kept by record_observations, or
+    # None if nothing has been observed for the city yet
+    with (engine or get_engine()).connect() as connection:
+        location = connection.exec_driver_sql(
+            "SELECT location_id FROM locations WHERE city_name = ?", (city_name,)).first()
+        if location is None:
+            return None
+        last_time, stats = load_online_stats(connection, location[0], [variable])[variable]
+    return stats.report(variable) if last_time is not None else None
@@ -1,9 +1,13 @@
 from view_model import create_gui
 from process_data import display_weather_info
+from background import BackgroundRunner
 
 def main():
-    root, city_entry, weather_text = create_gui(lambda: display_weather_info(city_entry, weather_text))
+    root, city_entry, weather_text, show_progress = create_gui(
+        lambda: display_weather_info(city_entry, weather_text, runner))
+    runner = BackgroundRunner(root, on_busy=show_progress)
     root.mainloop()
+    runner.shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,154 @@
+import math
+
+import numpy as np
+
+from sketch import TDigest
+from weather_stats import format_report
+
+ONLINE_SCHEMA = """CREATE TABLE IF NOT EXISTS online_stats (
+    location_id INTEGER NOT NULL REFERENCES locations (location_id),
+    variable TEXT NOT NULL,
+    last_time INTEGER NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (location_id, variable)
+) WITHOUT ROWID"""
+
+UPSERT_ONLINE = (
+    "INSERT INTO online_stats (location_id, variable, last_time, state) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (location_id, variable) DO UPDATE SET "
+    "last_time = excluded.last_time, state = excluded.state")
+
+_HEADER = 8
+
+
+class OnlineStats:
+    # Running statistics for one series, updated in O(1) per observation:
+    # Welford's mean and variance, min/max and a t-digest for quantiles.
+    # Values for the digest are buffered and folded in a batch at a time,
+    # which keeps the per-value cost constant. A peak (trough) is a value
+    # above (below) the mean plus (minus) one standard deviation of
+    # everything seen before it, so counts can differ slightly from a
+    # rescan, which compares against the final mean and deviation
+    def __init__(self, compression=100):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.peaks = 0
+        self.troughs = 0
+        self.digest = TDigest(compression)
+        self._buffer = []
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def update(self, value):
+        value = float(value)
+        if math.isnan(value):
+            return self
+        if self.count > 1:
+            std = self.std
+            if value > self.mean + std:
+                self.peaks += 1
+            elif value < self.mean - std:
+                self.troughs += 1
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._buffer.append(value)
+        if len(self._buffer) >= 4 * self.digest.compression:
+            self._flush()
+        return self
+
+    def update_many(self, values):
+        for value in np.asarray(values, dtype=np.float64).tolist():
+            self.update(value)
+        return self
+
+    def _flush(self):
+        if self._buffer:
+            self.digest.add(self._buffer)
+            self._buffer = []
+
+    def quantile(self, q):
+        self._flush()
+        return float(self.digest.quantile(q)) if self.count else math.nan
+
+    def as_dict(self):
+        q1, median, q3 = (self.quantile(q) for q in (0.25, 0.5, 0.75))
+        empty = not self.count
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": math.nan if empty else self.mean,
+            "median": median,
+            "max": math.nan if empty else self.max,
+            "min": math.nan if empty else self.min,
+            "std": self.std,
+            "range": math.nan if empty else self.max - self.min,
+            "q1": q1,
+            "q3": q3,
+            "iqr": q3 - q1,
+            "peaks": self.peaks,
+            "troughs": self.troughs,
+        }
+
+    def report(self, column):
+        return format_report(column, self.as_dict())
+
+    def to_bytes(self):
+        self._flush()
+        header = np.array(
+            [self.count, self.mean, self.m2, self.sum, self.min, self.max, self.peaks, self.troughs],
+            dtype=np.float64)
+        return header.tobytes() + self.digest.to_bytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        header = np.frombuffer(data[:_HEADER * 8], dtype=np.float64).tolist()
+        digest = TDigest.from_bytes(data[_HEADER * 8:])
+        stats = cls(compression=digest.compression)
+        stats.count, stats.mean, stats.m2, stats.sum, stats.min, stats.max = header[:6]
+        stats.count = int(stats.count)
+        stats.peaks, stats.troughs = int(header[6]), int(header[7])
+        stats.digest = digest
+        return stats
+
+
+def create_online_schema(connection):
+    connection.exec_driver_sql(ONLINE_SCHEMA)
+
+
+def load_online_stats(connection, location_id, variables):
+    # {variable: (last_time, OnlineStats)}; unseen variables start empty
+    states = {variable: (None, OnlineStats()) for variable in variables}
+    for variable, last_time, state in connection.exec_driver_sql(
+            "SELECT variable, last_time, state FROM online_stats WHERE location_id = ?", (location_id,)):
+        if variable in states:
+            states[variable] = (last_time, OnlineStats.from_bytes(state))
+    return states
+
+
+def observe(connection, location_id, times, values, variables):
+    # Feeds each variable only the points newer than the last one it has
+    # seen, so overlapping fetches are counted once. ``times`` are epoch
+    # seconds in ascending order, ``values`` an (n, len(variables)) array
+    times = np.asarray(times, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64).reshape(len(times), len(variables))
+    rows = []
+    for i, (variable, (last_time, stats)) in enumerate(load_online_stats(connection, location_id, variables).items()):
+        new = times > last_time if last_time is not None else np.ones(len(times), dtype=bool)
+        if not new.any():
+            continue
+        stats.update_many(values[new, i])
+        rows.append((location_id, variable, int(times[new][-1]), stats.to_bytes()))
+    if rows:
+        connection.exec_driver_sql(UPSERT_ONLINE, rows)
+    return len(rows)
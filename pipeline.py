@@ -0,0 +1,114 @@
+import queue
+import threading
+import time
+
+_DONE = object()
+
+
+class Stage:
+    # One step of a Pipeline. ``function`` gets a list of up to
+    # ``batch_size`` items and returns an iterable of outputs for the next
+    # stage. A batch is handed over once it is full, once ``max_wait``
+    # seconds have passed since its first item, or at the end of the input
+    def __init__(self, name, function, workers=1, batch_size=1, max_wait=0.0, queue_size=None):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        # Bounded, so a fast stage blocks instead of piling up work the next
+        # one cannot take yet
+        self.queue_size = queue_size or 2 * workers * batch_size
+
+
+class Pipeline:
+    # Stages run concurrently on their own worker threads, connected by
+    # bounded queues, so fetching, decoding and storing overlap and the
+    # throughput is set by the slowest stage. A failing batch is recorded
+    # in ``errors`` and its items are dropped; the rest keep flowing
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.errors = []
+        self.stats = {}
+
+    def run(self, items):
+        queues = [queue.Queue(stage.queue_size) for stage in self.stages]
+        results = []
+        self.errors = []
+        self.stats = {stage.name: {"items": 0, "batches": 0, "busy": 0.0, "blocked": 0.0} for stage in self.stages}
+        lock = threading.Lock()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            output = queues[index + 1] if index + 1 < len(queues) else None
+            remaining = [stage.workers]
+            for number in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[index], output, results, remaining, lock),
+                    name=f"{stage.name}-{number}",
+                    daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        started = time.perf_counter()
+        for item in items:
+            queues[0].put(item)
+        queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+        self.stats["total"] = time.perf_counter() - started
+        return results
+
+    def _next_batch(self, stage, source):
+        # Blocks for the first item, then collects more until the batch is
+        # full or max_wait runs out. Returns (batch, done)
+        item = source.get()
+        if item is _DONE:
+            return [], True
+        batch = [item]
+        deadline = time.perf_counter() + stage.max_wait
+        while len(batch) < stage.batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = source.get(timeout=timeout) if timeout > 0 else source.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _work(self, stage, source, output, results, remaining, lock):
+        stats = self.stats[stage.name]
+        done = False
+        while not done:
+            batch, done = self._next_batch(stage, source)
+            if not batch:
+                break
+            started = time.perf_counter()
+            try:
+                outputs = list(stage.function(batch))
+            except Exception as error:
+                outputs = []
+                with lock:
+                    self.errors.append((stage.name, batch, error))
+            busy = time.perf_counter() - started
+            for result in outputs:
+                if output is None:
+                    with lock:
+                        results.append(result)
+                else:
+                    output.put(result)
+            with lock:
+                stats["items"] += len(batch)
+                stats["batches"] += 1
+                stats["busy"] += busy
+                stats["blocked"] += time.perf_counter() - started - busy
+        # Let the other workers of this stage see the end too; the last one
+        # to stop passes it on
+        source.put(_DONE)
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and output is not None:
+            output.put(_DONE)
@@ -1,74 +1,64 @@
 import customtkinter as tk
-import pandas as pd
 from weather_api import fetch_weather_data
-from database import store_hourly_data, store_daily_data
+from database import store_forecast
+from forecast import Forecast
 from visualization import visualize_hourly_weather
-from city_input import get_city_coordinates
+from city_input import resolve_city
+from fuzzy_search import suggest_cities
 
-def display_weather_info(city_entry, weather_text):
-    city_name = city_entry.get()  # Retrieve the value from the Entry widget
-    latitude, longitude = get_city_coordinates(city_name)
-    if latitude is None or longitude is None:
-        return
+def load_weather(city_name, cancelled):
+    # Runs on a worker thread: lookup, fetch, processing and storage
+    # Stored under the canonical name, whatever spelling was typed
+    location, latitude, longitude = resolve_city(city_name)
+    if location is None:
+        # Fall back to the closest spelling, e.g. "Amsterdm" -> "Amsterdam"
+        suggestions = suggest_cities(city_name, 1)
+        if not suggestions:
+            return None
+        location, latitude, longitude = resolve_city(suggestions[0])
+    city_name = location
 
     # Fetch weather data
     response = fetch_weather_data(latitude, longitude)
+    if cancelled.is_set():
+        return None
+
+    forecast = Forecast.from_response(response, city_name)
+    hourly_dataframe = forecast.hourly_dataframe()
+    daily_dataframe = forecast.daily_dataframe()
+
+    # Store data in the database
+    store_forecast(hourly_dataframe, daily_dataframe, forecast.timezone)
+    return city_name, latitude, longitude, forecast
+
+def show_weather(result, city_entry, weather_text):
+    # Runs on the Tk main thread
+    if result is None:
+        return
+    city_name, latitude, longitude, forecast = result
+    if city_entry.get() != city_name:
+        city_entry.set(city_name)
 
     # Display weather information in the text widget
     weather_text.delete(1.0, tk.END) # Clear previous fetch result
     weather_text.insert(tk.END, f"City Name: {city_name}\n")
     weather_text.insert(tk.END, f"Coordinates: {latitude}°N, {longitude}°E\n\n")
-    weather_text.insert(tk.END, f"Elevation: {response.Elevation()} m asl\n")
-    weather_text.insert(tk.END, f"Timezone: {response.Timezone()} {response.TimezoneAbbreviation()}\n")
-
-    hourly_dataframe = process_hourly_data(response, city_name)
-    daily_dataframe = process_daily_data(response, city_name)
-
-    # Store data in the database
-    store_hourly_data(hourly_dataframe)
-    store_daily_data(daily_dataframe)
+    weather_text.insert(tk.END, f"Elevation: {forecast.elevation} m asl\n")
+    weather_text.insert(tk.END, f"Timezone: {forecast.timezone} {forecast.timezone_abbreviation}\n")
 
     # Visualize hourly temperature
-    visualize_hourly_weather(hourly_dataframe)
-
-def process_hourly_data(response, city_name):
-    hourly = response.Hourly()
-    hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-    hourly_relative_humidity_2m = hourly.Variables(1).ValuesAsNumpy()
-    hourly_precipitation = hourly.Variables(2).ValuesAsNumpy()
-    hourly_rain = hourly.Variables(3).ValuesAsNumpy()
-    hourly_cloud_cover = hourly.Variables(4).ValuesAsNumpy()
+    visualize_hourly_weather(forecast.hourly_dataframe())
 
-    hourly_data = {
-        "date": pd.date_range(
-            start=pd.to_datetime(hourly.Time(), unit="s", utc=True),
-            end=pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
-            freq=pd.Timedelta(seconds=hourly.Interval()),
-            inclusive="left"
-        )
-    }
-    hourly_data["city_name"] = city_name
-    hourly_data["temperature_2m"] = hourly_temperature_2m
-    hourly_data["relative_humidity_2m"] = hourly_relative_humidity_2m
-    hourly_data["precipitation"] = hourly_precipitation
-    hourly_data["rain"] = hourly_rain
-    hourly_data["cloud_cover"] = hourly_cloud_cover
+def display_weather_info(city_entry, weather_text, runner):
+    # The slow part runs on the runner's thread pool; a newer request
+    # replaces one still in flight
+    city_name = city_entry.get()  # Retrieve the value from the Entry widget
+    runner.submit(
+        lambda cancelled: load_weather(city_name, cancelled),
+        lambda result: show_weather(result, city_entry, weather_text))
 
-    return pd.DataFrame(data=hourly_data)
+def process_hourly_data(response, city_name):
+    return Forecast.from_response(response, city_name).hourly_dataframe()
 
 def process_daily_data(response, city_name):
-    daily = response.Daily()
-    daily_uv_index_max = daily.Variables(0).ValuesAsNumpy()
-
-    daily_data = {
-        "date": pd.date_range(
-            start=pd.to_datetime(daily.Time(), unit="s", utc=True),
-            end=pd.to_datetime(daily.TimeEnd(), unit="s", utc=True),
-            freq=pd.Timedelta(seconds=daily.Interval()),
-            inclusive="left"
-        )
-    }
-    daily_data["city_name"] = city_name
-    daily_data["uv_index_max"] = daily_uv_index_max
-
-    return pd.DataFrame(data=daily_data)
\ No newline at end of file
+    return Forecast.from_response(response, city_name).daily_dataframe()
@@ -0,0 +1,214 @@
+import argparse
+import functools
+import os
+import random
+import signal
+import threading
+import time
+
+from archive import compact
+from async_fetch import ThreadedFetcher
+from city_index import get_city_index
+from city_input import resolve_city
+from database import get_engine, record_observations, store_forecasts
+from forecast import Forecast
+from fuzzy_search import suggest_cities
+from pipeline import Pipeline, Stage
+from weather_api import fetch_weather_data_batch
+from weather_client import get_client
+
+DEFAULT_INTERVAL = 3600
+DEFAULT_JITTER = 0.1
+DEFAULT_FETCH_WORKERS = 4
+DEFAULT_DECODE_WORKERS = 2
+DEFAULT_FETCH_SIZE = 25
+DEFAULT_COMMIT_SIZE = 100
+COMMIT_WAIT = 1.0
+DEFAULT_COMPACT_INTERVAL = 86400
+
+
+def read_city_file(path):
+    # One city per line; blank lines and "#" comments are ignored
+    with open(path, encoding="utf-8") as file:
+        lines = (line.split("#", 1)[0].strip() for line in file)
+        return list(dict.fromkeys(line for line in lines if line))
+
+
+def resolve_cities(city_names):
+    # [(canonical name, latitude, longitude)], misspellings resolved like
+    # the GUI does; cities that cannot be found are reported and left out,
+    # and two spellings of one city are refreshed once
+    located = {}
+    for city_name in city_names:
+        location, latitude, longitude = resolve_city(city_name)
+        if location is None:
+            suggestions = suggest_cities(city_name, 1)
+            if not suggestions:
+                print(f"Skipping {city_name}: not found")
+                continue
+            location, latitude, longitude = resolve_city(suggestions[0])
+        located.setdefault(location, (location, latitude, longitude))
+    return list(located.values())
+
+
+def warm_up():
+    # Built once per process and reused by every cycle
+    get_city_index()
+    get_client()
+    get_engine()
+
+
+def _fetch(batch, fetch=fetch_weather_data_batch):
+    responses = fetch([(latitude, longitude) for _, latitude, longitude in batch])
+    return [(city_name, response) for (city_name, _, _), response in zip(batch, responses)]
+
+
+def _decode(batch):
+    frames = []
+    for city_name, response in batch:
+        forecast = Forecast.from_response(response, city_name)
+        frames.append((forecast.hourly_dataframe(), forecast.daily_dataframe(), forecast.timezone))
+    return frames
+
+
+def _store(batch):
+    # Group commit: every forecast in the batch goes into one transaction
+    stored = store_forecasts(batch)
+    record_observations([frames[0] for frames in batch])
+    return [stored]
+
+
+def refresh_cities(located, fetch_workers=DEFAULT_FETCH_WORKERS, decode_workers=DEFAULT_DECODE_WORKERS,
+                   fetch_size=DEFAULT_FETCH_SIZE, commit_size=DEFAULT_COMMIT_SIZE, fetch=fetch_weather_data_batch):
+    # One fetch -> decode -> store cycle as a pipeline, so requests, decoding
+    # and SQLite writes overlap. SQLite has a single writer, hence one store
+    # worker. ``fetch`` takes [(latitude, longitude)] and returns the
+    # responses in order. Returns the wall time and each stage's busy time
+    # in seconds
+    pipeline = Pipeline([
+        Stage("fetch", functools.partial(_fetch, fetch=fetch), workers=fetch_workers, batch_size=fetch_size),
+        Stage("decode", _decode, workers=decode_workers),
+        Stage("store", _store, batch_size=commit_size, max_wait=COMMIT_WAIT),
+    ])
+    results = pipeline.run(located)
+    timings = {
+        "cities": len(located),
+        "total": pipeline.stats["total"],
+        "rows": sum(stored["rows"] for stored in results),
+        "changed": sum(stored["changed"] for stored in results),
+        "commits": len(results),
+        "errors": pipeline.errors,
+    }
+    for stage in pipeline.stages:
+        timings[stage.name] = pipeline.stats[stage.name]["busy"]
+    return timings
+
+
+def format_timings(cycle, timings):
+    line = (
+        f"cycle {cycle}: {timings['cities']} cities in {timings['total']:.2f} s "
+        f"(busy: fetch {timings['fetch']:.2f} s, decode {timings['decode']:.2f} s, "
+        f"store {timings['store']:.2f} s; {timings['rows']} rows, {timings['changed']} changed, "
+        f"{timings['commits']} commits)")
+    for stage, batch, error in timings["errors"]:
+        line += f"\n  {stage} failed for {len(batch)} item(s): {error!r}"
+    return line
+
+
+def compact_history():
+    # Moves months past the archive cutoff from SQLite to Parquet
+    started = time.perf_counter()
+    archived = {table: compact(table) for table in ("hourly", "daily")}
+    return (
+        f"archived {archived['hourly']} hourly and {archived['daily']} daily rows "
+        f"in {time.perf_counter() - started:.2f} s")
+
+
+def next_delay(interval, jitter, elapsed):
+    # Spread over +/- jitter of the interval so many instances (or a restart)
+    # do not hit the API in lockstep
+    return max(interval * (1 + random.uniform(-jitter, jitter)) - elapsed, 0)
+
+
+def run(city_file, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER, cycles=None, stop=None,
+        compact_interval=DEFAULT_COMPACT_INTERVAL, async_fetch=False, **pipeline_options):
+    # Refreshes every city in ``city_file`` until ``stop`` is set or
+    # ``cycles`` have run. The file is re-read when it changes, so cities
+    # can be added without a restart. A failed cycle is reported and the
+    # next one runs on schedule. Old history is archived after the first
+    # cycle and then every ``compact_interval`` seconds (0 turns it off).
+    # With ``async_fetch`` the fetch stage goes through one asyncio fetcher
+    # with a per-location rate limit, bypassing the HTTP cache
+    stop = stop or threading.Event()
+    warm_up()
+    fetcher = ThreadedFetcher() if async_fetch else None
+    if fetcher is not None:
+        pipeline_options["fetch"] = fetcher.fetch_many
+    try:
+        _run_cycles(city_file, interval, jitter, cycles, stop, compact_interval, pipeline_options)
+    finally:
+        if fetcher is not None:
+            fetcher.close()
+
+
+def _run_cycles(city_file, interval, jitter, cycles, stop, compact_interval, pipeline_options):
+    located, modified = [], None
+    compacted = None
+    cycle = 0
+    while not stop.is_set() and (cycles is None or cycle < cycles):
+        cycle += 1
+        started = time.perf_counter()
+        try:
+            mtime = os.path.getmtime(city_file)
+            if mtime != modified:
+                located, modified = resolve_cities(read_city_file(city_file)), mtime
+            if located:
+                print(format_timings(cycle, refresh_cities(located, **pipeline_options)), flush=True)
+            else:
+                print(f"cycle {cycle}: no cities to refresh", flush=True)
+        except Exception as error:
+            print(f"cycle {cycle} failed: {error!r}", flush=True)
+        if compact_interval and (compacted is None or time.monotonic() - compacted >= compact_interval):
+            compacted = time.monotonic()
+            try:
+                print(f"cycle {cycle}: {compact_history()}", flush=True)
+            except Exception as error:
+                print(f"cycle {cycle}: archiving failed: {error!r}", flush=True)
+        if cycles is None or cycle < cycles:
+            stop.wait(next_delay(interval, jitter, time.perf_counter() - started))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch and store forecasts for a list of cities on a schedule.")
+    parser.add_argument("city_file", help="text file with one city per line")
+    parser.add_argument("--once", action="store_true", help="run a single cycle and exit")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between cycles")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_JITTER, help="random spread, as a fraction of the interval")
+    parser.add_argument("--fetch-workers", type=int, default=DEFAULT_FETCH_WORKERS)
+    parser.add_argument("--decode-workers", type=int, default=DEFAULT_DECODE_WORKERS)
+    parser.add_argument("--fetch-size", type=int, default=DEFAULT_FETCH_SIZE, help="cities per request")
+    parser.add_argument("--commit-size", type=int, default=DEFAULT_COMMIT_SIZE, help="cities per transaction")
+    parser.add_argument(
+        "--compact-interval", type=float, default=DEFAULT_COMPACT_INTERVAL,
+        help="seconds between archiving old history to Parquet (0 disables)")
+    parser.add_argument(
+        "--async-fetch", action="store_true",
+        help="fetch with the rate-limited asyncio client instead of the cached session")
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        run(
+            args.city_file, args.interval, args.jitter, 1 if args.once else None, stop, args.compact_interval,
+            args.async_fetch,
+            fetch_workers=args.fetch_workers, decode_workers=args.decode_workers,
+            fetch_size=args.fetch_size, commit_size=args.commit_size)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        get_client().close()
+
+
+if __name__ == "__main__":
+    main()
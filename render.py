@@ -0,0 +1,158 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pytz
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import imsave
+
+import database
+from city_input import resolve_city
+from dashboard import DashboardFigure, get_color_gradient
+from forecast import Forecast
+from history import city_timezone, read_hourly
+from weather_api import fetch_weather_data_batch
+
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "renders")
+FORMATS = ("png", "svg")
+STORED_DAYS = 3
+MAX_BACKGROUNDS = 16
+
+# One dashboard per worker process, built by the pool initializer and reused
+# for every city that worker renders. For PNG the lines are animated and
+# the rendered axes (everything but the lines) are kept per theme and
+# limits, so a city whose snapped limits were seen before costs one
+# restore and five lines instead of a full draw
+_view = None
+_backgrounds = {}
+
+
+def _init_worker(figsize, dpi, fmt):
+    global _view
+    # A forked worker inherits the parent's engine and its pooled SQLite
+    # connections, which must not be used across fork(); it opens its own
+    if database._engine is not None:
+        database._engine.dispose(close=False)
+    _view = DashboardFigure(figsize=figsize, animated=fmt == "png")
+    _view.figure.set_dpi(dpi)
+    FigureCanvasAgg(_view.figure)
+
+
+def local_hour(tz_name=None, longitude=None):
+    # The city's hour of day from its timezone, or, for stored data saved
+    # without one, solar time from the longitude
+    if tz_name:
+        return datetime.now(pytz.timezone(tz_name)).hour
+    offset = timedelta(hours=(longitude or 0) / 15)
+    return (datetime.now(timezone.utc) + offset).hour
+
+
+def output_path(city_name, out_dir, fmt):
+    return os.path.join(out_dir, f"{quote(city_name, safe='')}.{fmt}")
+
+
+def _render(job):
+    city_name, data, hour, longitude, path = job
+    if data is None:
+        # Stored mode: each worker reads its own cities, and their
+        # timezones, from SQLite
+        start = pd.Timestamp.now(tz="UTC").floor("h") - pd.Timedelta(days=STORED_DAYS)
+        data = read_hourly(city_name, start=start)
+        if data.empty:
+            return city_name, None
+        hour = local_hour(city_timezone(city_name), longitude)
+    if isinstance(data, Forecast):
+        dates, columns = data.hourly_times.astype("datetime64[s]"), data
+    else:
+        dates, columns = data["date"], data
+    _view.set_colors(*get_color_gradient(hour))
+    _view.set_data(dates, columns)
+    if path.endswith(".png"):
+        _blit_png(path)
+    else:
+        _view.figure.savefig(path, facecolor=_view.figure.get_facecolor())
+    return city_name, path
+
+
+def _blit_png(path):
+    canvas = _view.figure.canvas
+    key = (_view.colors, tuple((ax.get_xlim(), ax.get_ylim()) for ax in _view.axes.values()))
+    background = _backgrounds.get(key)
+    if background is None:
+        if len(_backgrounds) >= MAX_BACKGROUNDS:
+            _backgrounds.pop(next(iter(_backgrounds)))
+        canvas.draw()
+        background = _backgrounds[key] = canvas.copy_from_bbox(_view.figure.bbox)
+    else:
+        canvas.restore_region(background)
+    _view.draw_lines()
+    imsave(path, np.asarray(canvas.buffer_rgba()), dpi=_view.figure.dpi)
+
+
+def _jobs(locations, out_dir, fmt, stored):
+    located = [(location,) + tuple(coordinates) for location, coordinates in locations.items()]
+    if stored:
+        return [
+            (city_name, None, None, longitude, output_path(city_name, out_dir, fmt))
+            for city_name, latitude, longitude in located]
+    # Live mode: one batched request for every city, then only the compact
+    # Forecast arrays are shipped to the workers
+    responses = fetch_weather_data_batch([(latitude, longitude) for _, latitude, longitude in located])
+    jobs = []
+    for (city_name, _, longitude), response in zip(located, responses):
+        forecast = Forecast.from_response(response, city_name)
+        jobs.append((city_name, forecast, local_hour(forecast.timezone), longitude, output_path(city_name, out_dir, fmt)))
+    return jobs
+
+
+def render_cities(city_names, out_dir=OUTPUT_DIR, fmt="png", workers=None, stored=False,
+                  figsize=(12, 8), dpi=100):
+    # Renders the hourly dashboard of every city to ``out_dir``. Returns
+    # {city: path}; cities that could not be located or have no stored
+    # data are left out
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format {fmt!r}, expected one of {FORMATS}")
+    os.makedirs(out_dir, exist_ok=True)
+    # Rendered once per canonical name, which is what stored data is keyed
+    # on and what the file is named after
+    names, locations = {}, {}
+    for city_name in city_names:
+        location, latitude, longitude = resolve_city(city_name)
+        if location is not None:
+            names[city_name] = location
+            locations[location] = (latitude, longitude)
+    jobs = _jobs(locations, out_dir, fmt, stored)
+    if not jobs:
+        return {}
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(figsize, dpi, fmt)) as pool:
+        results = pool.map(_render, jobs, chunksize=max(len(jobs) // (workers * 4), 1))
+        rendered = {location: path for location, path in results if path is not None}
+    return {city_name: rendered[location] for city_name, location in names.items() if location in rendered}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render hourly weather dashboards without a display.")
+    parser.add_argument("cities", nargs="+", help="city names, as in the app")
+    parser.add_argument("--out", default=OUTPUT_DIR, help="output directory")
+    parser.add_argument("--format", default="png", choices=FORMATS)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--stored", action="store_true", help="render stored history instead of fetching")
+    parser.add_argument("--dpi", type=int, default=100)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rendered = render_cities(args.cities, args.out, args.format, args.workers, args.stored, dpi=args.dpi)
+    for city_name in args.cities:
+        if city_name not in rendered:
+            print(f"Skipped {city_name}: no data")
+    print(f"Rendered {len(rendered)} dashboards to {args.out} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import numpy as np
+
+from sketch import TDigest
+
+PERIODS = ("day", "week", "month")
+DAY = 86400
+WEEK = 7 * DAY
+# 1970-01-01 was a Thursday; weeks start on Monday
+WEEK_OFFSET = 4 * DAY
+
+# Per location, variable, period and UTC bucket start: enough to merge any
+# set of buckets exactly (count, sum, min, max and the sum of squared
+# deviations for the variance) plus a quantile sketch
+ROLLUP_SCHEMA = """CREATE TABLE IF NOT EXISTS rollups (
+    location_id INTEGER NOT NULL REFERENCES locations (location_id),
+    variable TEXT NOT NULL,
+    period TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL,
+    m2 REAL,
+    min REAL,
+    max REAL,
+    sketch BLOB,
+    PRIMARY KEY (location_id, variable, period, bucket)
+) WITHOUT ROWID"""
+
+UPSERT_ROLLUP = (
+    "INSERT INTO rollups (location_id, variable, period, bucket, count, sum, m2, min, max, sketch) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (location_id, variable, period, bucket) DO UPDATE SET "
+    "count = excluded.count, sum = excluded.sum, m2 = excluded.m2, "
+    "min = excluded.min, max = excluded.max, sketch = excluded.sketch")
+
+
+def bucket_start(times, period):
+    times = np.asarray(times, dtype=np.int64)
+    if period == "day":
+        return times - times % DAY
+    if period == "week":
+        return (times - WEEK_OFFSET) // WEEK * WEEK + WEEK_OFFSET
+    return times.astype("datetime64[s]").astype("datetime64[M]").astype("datetime64[s]").astype(np.int64)
+
+
+def bucket_end(starts, period):
+    starts = np.asarray(starts, dtype=np.int64)
+    if period == "day":
+        return starts + DAY
+    if period == "week":
+        return starts + WEEK
+    months = starts.astype("datetime64[s]").astype("datetime64[M]") + 1
+    return months.astype("datetime64[s]").astype(np.int64)
+
+
+class Aggregate:
+    # Mergeable summary of one variable over any span of time
+    def __init__(self, count=0, total=0.0, m2=0.0, minimum=np.inf, maximum=-np.inf, sketch=None):
+        self.count = count
+        self.sum = total
+        self.m2 = m2
+        self.min = minimum
+        self.max = maximum
+        self.sketch = sketch or TDigest()
+
+    @classmethod
+    def from_values(cls, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return cls()
+        mean = values.mean()
+        return cls(
+            len(values), float(values.sum()), float(((values - mean) ** 2).sum()),
+            float(values.min()), float(values.max()), TDigest().add(values))
+
+    @classmethod
+    def from_row(cls, count, total, m2, minimum, maximum, sketch):
+        if not count:
+            return cls()
+        return cls(count, total, m2, minimum, maximum, TDigest.from_bytes(sketch))
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        # Sample standard deviation, as pandas reports it
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def merge(self, other):
+        # Chan et al.: combine the squared deviations of two partitions
+        if not other.count:
+            return self
+        if self.count:
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta ** 2 * self.count * other.count / (self.count + other.count)
+        else:
+            self.m2 = other.m2
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def to_row(self):
+        return self.count, self.sum, self.m2, self.min, self.max, self.sketch.to_bytes()
+
+
+def create_rollup_schema(connection):
+    # Returns True when the table is new and needs to be filled
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollups'").first()
+    connection.exec_driver_sql(ROLLUP_SCHEMA)
+    return exists is None
+
+
+def track_changes(connection, table):
+    # Temporary triggers record the key of every row the upserts actually
+    # insert or change (unchanged rows are skipped by the upsert and never
+    # fire them). Temporary objects live per connection, hence IF NOT EXISTS
+    changes = f"rollup_changes_{table}"
+    connection.exec_driver_sql(
+        f"CREATE TEMP TABLE IF NOT EXISTS {changes} ("
+        f"location_id INTEGER NOT NULL, time INTEGER NOT NULL, "
+        f"PRIMARY KEY (location_id, time)) WITHOUT ROWID")
+    for event in ("INSERT", "UPDATE"):
+        connection.exec_driver_sql(
+            f"CREATE TEMP TRIGGER IF NOT EXISTS {changes}_{event.lower()} AFTER {event} ON main.{table} "
+            f"BEGIN INSERT OR IGNORE INTO {changes} VALUES (NEW.location_id, NEW.time); END")
+
+
+def take_changes(connection, table):
+    # {location_id: changed times} recorded since the last call, and clears them
+    changes = f"rollup_changes_{table}"
+    raw = connection.connection.driver_connection
+    rows = raw.execute(f"SELECT location_id, time FROM {changes} ORDER BY location_id, time").fetchall()
+    raw.execute(f"DELETE FROM {changes}")
+    if not rows:
+        return {}
+    keys = np.array(rows, dtype=np.int64)
+    starts = np.concatenate([[0], np.flatnonzero(keys[1:, 0] != keys[:-1, 0]) + 1])
+    return {int(keys[start, 0]): times for start, times in zip(starts, np.split(keys[:, 1], starts[1:]))}
+
+
+def _bucket_rows(location_id, columns, times, values, wanted=None):
+    # Aggregates for every bucket of the rows, or only those whose start is
+    # in ``wanted[period]``. The moments of all buckets and columns of a
+    # period come from a handful of reduceat calls; only the sketches are
+    # built one at a time
+    missing = np.isnan(values)
+    zeroed = np.where(missing, 0.0, values)
+    rows = []
+    for period in PERIODS:
+        buckets = bucket_start(times, period)
+        starts = np.concatenate([[0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1])
+        if wanted is not None:
+            keep = np.isin(buckets[starts], list(wanted[period]))
+        else:
+            keep = np.ones(len(starts), dtype=bool)
+        if not keep.any():
+            continue
+        stops = np.append(starts[1:], len(times))
+        counts = np.add.reduceat(~missing, starts, axis=0)
+        sums = np.add.reduceat(zeroed, starts, axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        deviations = np.where(missing, 0.0, values - np.repeat(means, stops - starts, axis=0))
+        m2s = np.add.reduceat(deviations ** 2, starts, axis=0)
+        minimums = np.minimum.reduceat(np.where(missing, np.inf, values), starts, axis=0)
+        maximums = np.maximum.reduceat(np.where(missing, -np.inf, values), starts, axis=0)
+        for b in np.flatnonzero(keep).tolist():
+            start, stop, bucket = int(starts[b]), int(stops[b]), int(buckets[starts[b]])
+            for i, column in enumerate(columns):
+                count = int(counts[b, i])
+                if count:
+                    aggregate = Aggregate(
+                        count, float(sums[b, i]), float(m2s[b, i]),
+                        float(minimums[b, i]), float(maximums[b, i]),
+                        TDigest().add(values[start:stop, i]))
+                else:
+                    aggregate = Aggregate()
+                rows.append((location_id, column, period, bucket) + aggregate.to_row())
+    return rows
+
+
+def _location_rows(raw, table, columns, location_id, first, last, wanted=None):
+    # Plain sqlite3 tuples convert to an array far faster than Row objects
+    stored = raw.execute(
+        f"SELECT time, {', '.join(columns)} FROM {table} "
+        f"WHERE location_id = ? AND time >= ? AND time < ? ORDER BY time",
+        (location_id, first, last)).fetchall()
+    if not stored:
+        return []
+    values = np.array(stored, dtype=np.float64)
+    return _bucket_rows(location_id, columns, values[:, 0].astype(np.int64), values[:, 1:], wanted)
+
+
+def update_rollups(connection, table, columns, changes):
+    # Recomputes, per location, only the day, week and month buckets that
+    # contain a changed row (``changes`` as returned by take_changes), from
+    # the rows now stored over just those buckets. Only recent buckets are
+    # ever touched, and those are still in SQLite; the archive only takes
+    # months that ended long ago
+    raw = connection.connection.driver_connection
+    rows = []
+    for location_id, times in changes.items():
+        wanted = {period: set(np.unique(bucket_start(times, period)).tolist()) for period in PERIODS}
+        first = min(min(starts) for starts in wanted.values())
+        last = max(int(bucket_end(max(starts), period)) for period, starts in wanted.items())
+        rows.extend(_location_rows(raw, table, columns, location_id, first, last, wanted))
+    if rows:
+        connection.exec_driver_sql(UPSERT_ROLLUP, rows)
+    return len(rows)
+
+
+def rebuild_rollups(connection, table, columns):
+    raw = connection.connection.driver_connection
+    locations = connection.exec_driver_sql(
+        f"SELECT location_id, MIN(time), MAX(time) FROM {table} GROUP BY location_id").fetchall()
+    for location_id, first_time, last_time in locations:
+        first = int(min(bucket_start(first_time, period) for period in PERIODS))
+        last = int(max(bucket_end(bucket_start(last_time, period), period) for period in PERIODS))
+        rows = _location_rows(raw, table, columns, location_id, first, last)
+        if rows:
+            connection.exec_driver_sql(UPSERT_ROLLUP, rows)
+
+
+def cover(start, end):
+    # Fewest buckets exactly covering whole days [start, end): months where
+    # they fit, weeks that stay inside one month, then single days, so a
+    # span of years needs only a few dozen buckets
+    buckets = []
+    position = start
+    while position < end:
+        month_end = int(bucket_end(bucket_start(position, "month"), "month"))
+        for period in ("month", "week", "day"):
+            if int(bucket_start(position, period)) != position:
+                continue
+            stop = int(bucket_end(position, period))
+            if stop <= end and (period != "week" or stop <= month_end):
+                buckets.append((period, position))
+                position = stop
+                break
+    return buckets
+
+
+def read_rollups(connection, location_id, variable, buckets):
+    aggregate = Aggregate()
+    for period in PERIODS:
+        starts = [bucket for bucket_period, bucket in buckets if bucket_period == period]
+        for offset in range(0, len(starts), 500):
+            chunk = starts[offset:offset + 500]
+            for row in connection.exec_driver_sql(
+                    f"SELECT count, sum, m2, min, max, sketch FROM rollups "
+                    f"WHERE location_id = ? AND variable = ? AND period = ? "
+                    f"AND bucket IN ({', '.join('?' for _ in chunk)})",
+                    (location_id, variable, period, *chunk)):
+                aggregate.merge(Aggregate.from_row(*row))
+    return aggregate
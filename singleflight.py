@@ -0,0 +1,57 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    # Concurrent calls for the same key share one in-flight result instead
+    # of each doing the work; the key is forgotten once the call completes
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do_many(self, keys, fn):
+        # ``fn`` gets the indices of the keys this caller has to produce and
+        # returns their results in that order; every other key (already in
+        # flight, or repeated within ``keys``) waits on the existing call
+        futures = []
+        owned = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                self.calls += 1
+                future = self._in_flight.get(key)
+                if future is None:
+                    future = Future()
+                    self._in_flight[key] = future
+                    owned.append(i)
+                else:
+                    self.coalesced += 1
+                futures.append(future)
+
+        if owned:
+            try:
+                results = fn(owned)
+                for i, result in zip(owned, results):
+                    futures[i].set_result(result)
+            except BaseException as exc:
+                for i in owned:
+                    if not futures[i].done():
+                        futures[i].set_exception(exc)
+                raise
+            finally:
+                with self._lock:
+                    for i in owned:
+                        self._in_flight.pop(keys[i], None)
+        return [future.result() for future in futures]
+
+    def do(self, key, fn):
+        return self.do_many([key], lambda owned: [fn()])[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+            }
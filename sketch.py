@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class TDigest:
+    # Mergeable quantile sketch. Values are kept as weighted centroids whose
+    # size is limited by the arcsine scale function: centroids near the
+    # tails stay small, so extreme quantiles remain accurate, and the whole
+    # sketch never holds more than about ``compression`` / 2 centroids
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        centers = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * centers - 1)
+        # Neighbours that fall into the same unit of k form one centroid
+        clusters = np.floor(k - k[0]).astype(np.int64)
+        starts = np.concatenate([[0], np.flatnonzero(clusters[1:] != clusters[:-1]) + 1])
+        merged_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged_weights
+        self.weights = merged_weights
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        if not len(self.weights) and len(values) <= self.compression / np.pi:
+            # So few points are at least one unit of k apart everywhere, and
+            # each would end up as its own centroid anyway
+            self.means = np.sort(values)
+            self.weights = np.ones(len(values))
+            return self
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+        return self
+
+    def merge(self, other):
+        if not len(other.weights):
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+
+    def quantile(self, q):
+        # Interpolates between centroid centres, pinned to the exact extremes
+        if not len(self.weights):
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        total = self.weights.sum()
+        positions = np.r_[0.0, np.cumsum(self.weights) - self.weights / 2, total]
+        values = np.r_[self.min, self.means, self.max]
+        return np.interp(np.asarray(q) * total, positions, values)
+
+    def to_bytes(self):
+        header = np.array([self.compression, self.min, self.max], dtype=np.float64)
+        return np.concatenate([header, self.means, self.weights]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        values = np.frombuffer(data, dtype=np.float64)
+        digest = cls(compression=values[0])
+        digest.min, digest.max = values[1], values[2]
+        n = (len(values) - 3) // 2
+        digest.means = values[3:3 + n].copy()
+        digest.weights = values[3 + n:].copy()
+        return digest
@@ -0,0 +1,194 @@
+import threading
+
+import numpy as np
+
+from gazetteer import get_gazetteer
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def unit_vectors(latitudes, longitudes):
+    lat = np.radians(latitudes)
+    lng = np.radians(longitudes)
+    return np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def _chord_to_km(similarity):
+    # Great-circle distance from the dot product of two unit vectors
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip((1 - similarity) / 2, 0, 1)))
+
+
+def _top_k(similarity, k):
+    best = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    best_d = _chord_to_km(np.take_along_axis(similarity, best, axis=1))
+    by_distance = np.argsort(best_d, axis=1)
+    return np.take_along_axis(best, by_distance, axis=1), np.take_along_axis(best_d, by_distance, axis=1)
+
+
+def snap_to_grid(latitude, longitude, resolution=0.1):
+    # Nearby points collapse onto the same grid node, so requests for them
+    # can share one cached forecast
+    latitude = np.clip(np.round(np.asarray(latitude) / resolution) * resolution, -90, 90)
+    longitude = np.round(np.asarray(longitude) / resolution) * resolution
+    longitude = (longitude + 180) % 360 - 180
+    return np.round(latitude, 6), np.round(longitude, 6)
+
+
+class SpatialIndex:
+    def __init__(self, gazetteer, cell_degrees=1.0, max_ring=8):
+        self.gazetteer = gazetteer
+        self.cell_degrees = cell_degrees
+        self.max_ring = max_ring
+        self._lat = np.asarray(gazetteer.lat, dtype=np.float64)
+        self._lng = np.asarray(gazetteer.lng, dtype=np.float64)
+        self._vectors = unit_vectors(self._lat, self._lng)
+        self._n_lat = int(np.ceil(180 / cell_degrees))
+        self._n_lng = int(np.ceil(360 / cell_degrees))
+
+        # Bucket rows into a lat/lng grid stored CSR-style: rows sorted by cell
+        # id, plus the offset where each cell starts. Cells in the same grid
+        # row are adjacent, so a window is a few contiguous slices
+        lat_bins, lng_bins = self._bins(self._lat, self._lng)
+        cells = lat_bins * self._n_lng + lng_bins
+        self._order = np.argsort(cells, kind="stable")
+        self._cell_start = np.searchsorted(
+            cells[self._order], np.arange(self._n_lat * self._n_lng + 1))
+
+    def __len__(self):
+        return len(self._lat)
+
+    def _bins(self, latitudes, longitudes):
+        lat_bins = np.floor((latitudes + 90) / self.cell_degrees).astype(np.int64)
+        lng_bins = np.floor((longitudes + 180) / self.cell_degrees).astype(np.int64)
+        return np.clip(lat_bins, 0, self._n_lat - 1), lng_bins % self._n_lng
+
+    def _is_global(self, ring):
+        return 2 * ring + 1 >= max(self._n_lat, self._n_lng)
+
+    def _window_rows(self, lat_bin, lng_bin, ring):
+        if self._is_global(ring):
+            return self._order
+        lng_ranges = [(lng_bin - ring, lng_bin + ring + 1)]
+        if 2 * ring + 1 >= self._n_lng:
+            lng_ranges = [(0, self._n_lng)]
+        elif lng_bin - ring < 0:
+            lng_ranges = [(0, lng_bin + ring + 1), (lng_bin - ring + self._n_lng, self._n_lng)]
+        elif lng_bin + ring + 1 > self._n_lng:
+            lng_ranges = [(lng_bin - ring, self._n_lng), (0, lng_bin + ring + 1 - self._n_lng)]
+
+        slices = []
+        for row in range(max(lat_bin - ring, 0), min(lat_bin + ring, self._n_lat - 1) + 1):
+            first = row * self._n_lng
+            for start, stop in lng_ranges:
+                slices.append(self._order[self._cell_start[first + start]:self._cell_start[first + stop]])
+        return np.concatenate(slices)
+
+    def _covered_km(self, lat_bin, ring):
+        # Any row outside the window is at least this far from every point
+        # of the query cell; beyond it the window result may be incomplete
+        if self._is_global(ring):
+            return np.inf
+        span = ring * self.cell_degrees
+        edge_lat = max(
+            abs(-90 + (lat_bin - ring) * self.cell_degrees),
+            abs(-90 + (lat_bin + ring + 1) * self.cell_degrees))
+        if 2 * ring + 1 >= self._n_lng:
+            east_west = np.inf
+        else:
+            reach = np.cos(np.radians(min(edge_lat, 90))) * np.sin(np.radians(min(span, 90)))
+            east_west = EARTH_RADIUS_KM * np.arcsin(reach)
+        return min(span * KM_PER_DEGREE, east_west)
+
+    def _groups(self, latitudes, longitudes):
+        lat_bins, lng_bins = self._bins(latitudes, longitudes)
+        cells, inverse = np.unique(lat_bins * self._n_lng + lng_bins, return_inverse=True)
+        for group, cell in enumerate(cells.tolist()):
+            yield divmod(cell, self._n_lng), np.flatnonzero(inverse == group)
+
+    def nearest(self, latitudes, longitudes, k=1):
+        # Points sharing a grid cell are answered together: one matrix product
+        # of unit vectors against the rows around that cell ranks them all
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        queries = unit_vectors(latitudes, longitudes)
+        k = min(k, len(self))
+        distances = np.empty((len(latitudes), k))
+        rows = np.empty((len(latitudes), k), dtype=np.int64)
+
+        remote = []
+        for (lat_bin, lng_bin), pending in self._groups(latitudes, longitudes):
+            ring = 1
+            while len(pending):
+                if ring > self.max_ring:
+                    remote.append(pending)
+                    break
+                candidates = self._window_rows(lat_bin, lng_bin, ring)
+                if len(candidates) < k:
+                    ring *= 2
+                    continue
+                best, best_d = _top_k(queries[pending] @ self._vectors[candidates].T, k)
+                done = best_d[:, -1] <= self._covered_km(lat_bin, ring)
+                distances[pending[done]] = best_d[done]
+                rows[pending[done]] = candidates[best[done]]
+                pending = pending[~done]
+                if len(pending):
+                    # The k-th distance found so far bounds the true one,
+                    # so jump straight to a window that covers it
+                    needed = best_d[~done, -1].max()
+                    while ring <= self.max_ring and self._covered_km(lat_bin, ring) < needed:
+                        ring += 1
+
+        # Points far from any city (open ocean, poles) would need most of the
+        # globe anyway; rank them against every row in a few large products
+        if remote:
+            remote = np.concatenate(remote)
+            for chunk in np.array_split(remote, -(-len(remote) // 1024)):
+                best, best_d = _top_k(queries[chunk] @ self._vectors.T, k)
+                distances[chunk] = best_d
+                rows[chunk] = best
+        return distances, rows
+
+    def within(self, latitudes, longitudes, radius_km):
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        queries = unit_vectors(latitudes, longitudes)
+        results = [None] * len(latitudes)
+
+        for (lat_bin, lng_bin), points in self._groups(latitudes, longitudes):
+            ring = 1
+            while self._covered_km(lat_bin, ring) < radius_km:
+                ring *= 2
+            candidates = self._window_rows(lat_bin, lng_bin, ring)
+            d = _chord_to_km(queries[points] @ self._vectors[candidates].T)
+            for i, point in enumerate(points.tolist()):
+                inside = np.flatnonzero(d[i] <= radius_km)
+                by_distance = inside[np.argsort(d[i, inside])]
+                results[point] = (candidates[by_distance], d[i, by_distance])
+        return results
+
+
+_spatial_index = None
+_spatial_index_lock = threading.Lock()
+
+
+def get_spatial_index():
+    global _spatial_index
+    if _spatial_index is None:
+        with _spatial_index_lock:
+            if _spatial_index is None:
+                _spatial_index = SpatialIndex(get_gazetteer())
+    return _spatial_index
+
+
+def nearest_city(latitude, longitude):
+    index = get_spatial_index()
+    distances, rows = index.nearest(latitude, longitude)
+    return index.gazetteer.value("city", int(rows[0, 0])), float(distances[0, 0])
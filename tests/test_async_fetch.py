@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import time
+
+import flatbuffers
+import numpy as np
+import pytest
+from aiohttp import web
+from openmeteo_sdk.Variable import Variable
+
+import database
+from async_fetch import AsyncWeatherFetcher, ThreadedFetcher, TokenBucket
+from refresh import refresh_cities
+
+START = 1714521600
+HOURS = 48
+
+
+def _series(builder, variables, start, interval):
+    # A VariablesWithTime table: (variable, values, altitude, aggregation)
+    offsets = []
+    for variable, values, altitude, aggregation in variables:
+        builder.StartVector(4, len(values), 4)
+        for value in reversed(values):
+            builder.PrependFloat32(float(value))
+        vector = builder.EndVector()
+        builder.StartObject(13)
+        builder.PrependUint8Slot(0, variable, 0)
+        builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+        builder.PrependInt16Slot(5, altitude, 0)
+        builder.PrependUint8Slot(6, aggregation, 0)
+        offsets.append(builder.EndObject())
+    builder.StartVector(4, len(offsets), 4)
+    for offset in reversed(offsets):
+        builder.PrependUOffsetTRelative(offset)
+    vector = builder.EndVector()
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, start, 0)
+    builder.PrependInt64Slot(1, start + len(variables[0][1]) * interval, 0)
+    builder.PrependInt32Slot(2, interval, 0)
+    builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+    return builder.EndObject()
+
+
+def _message(latitude, longitude):
+    # One length-prefixed WeatherApiResponse with the variables the app asks for
+    values = np.random.default_rng(int(abs(latitude) * 1000)).random((6, HOURS))
+    builder = flatbuffers.Builder(1024)
+    hourly = _series(builder, [
+        (Variable.temperature, values[0] * 30, 2, 0),
+        (Variable.relative_humidity, values[1] * 100, 2, 0),
+        (Variable.precipitation, values[2], 0, 0),
+        (Variable.rain, values[3], 0, 0),
+        (Variable.cloud_cover, values[4] * 100, 0, 0),
+    ], START, 3600)
+    daily = _series(builder, [(Variable.uv_index, values[5][:HOURS // 24] * 8, 0, 2)], START, 86400)
+    timezone = builder.CreateString("Europe/Paris")
+    abbreviation = builder.CreateString("CEST")
+    builder.StartObject(16)
+    builder.PrependFloat32Slot(0, latitude, 0.0)
+    builder.PrependFloat32Slot(1, longitude, 0.0)
+    builder.PrependFloat32Slot(2, 35.0, 0.0)
+    builder.PrependInt32Slot(6, 7200, 0)
+    builder.PrependUOffsetTRelativeSlot(7, timezone, 0)
+    builder.PrependUOffsetTRelativeSlot(8, abbreviation, 0)
+    builder.PrependUOffsetTRelativeSlot(10, daily, 0)
+    builder.PrependUOffsetTRelativeSlot(11, hourly, 0)
+    builder.Finish(builder.EndObject())
+    data = bytes(builder.Output())
+    return len(data).to_bytes(4, "little") + data
+
+
+class StubServer:
+    # A local Open-Meteo stand-in on its own event loop thread. Records the
+    # number of locations in every request; the first ``failures`` requests
+    # are answered with a 502
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.requests = []
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self.url = asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/v1/forecast", self._forecast)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/v1/forecast"
+
+    async def _forecast(self, request):
+        latitudes = [float(value) for value in request.query["latitude"].split(",")]
+        longitudes = [float(value) for value in request.query["longitude"].split(",")]
+        self.requests.append(len(latitudes))
+        if len(self.requests) <= self.failures:
+            return web.Response(status=502)
+        return web.Response(body=b"".join(_message(*location) for location in zip(latitudes, longitudes)))
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+@pytest.fixture
+def server():
+    stub = StubServer()
+    yield stub
+    stub.close()
+
+
+def _coordinates(count):
+    return [(round(-60 + i * 0.37, 4), round(-170 + i * 1.1, 4)) for i in range(count)]
+
+
+def _fetch(coordinates, **options):
+    async def run():
+        async with AsyncWeatherFetcher(**options) as fetcher:
+            return await fetcher.fetch_many(coordinates)
+    return asyncio.run(run())
+
+
+def test_chunks_requests_and_keeps_order(server):
+    coordinates = _coordinates(250)
+    responses = _fetch(coordinates, url=server.url, rate=10000, burst=100, max_locations=100)
+    assert sorted(server.requests) == [50, 100, 100]
+    assert [(round(r.Latitude(), 3), round(r.Longitude(), 3)) for r in responses] == [
+        (round(latitude, 3), round(longitude, 3)) for latitude, longitude in coordinates]
+
+
+def test_retries_server_errors(server):
+    server.failures = 2
+    responses = _fetch(_coordinates(3), url=server.url, rate=10000, backoff_factor=0.01)
+    assert server.requests == [3, 3, 3]
+    assert len(responses) == 3
+
+
+def test_rate_limit_is_charged_per_location(server):
+    # 30 locations at 100 per second with a burst of 10: the first chunk
+    # goes out at once, the other two wait for 20 tokens, about 0.2 s
+    started = time.monotonic()
+    _fetch(_coordinates(30), url=server.url, rate=100, burst=10, max_locations=100)
+    elapsed = time.monotonic() - started
+    # Chunks are capped at the burst so each one can be paid for
+    assert server.requests == [10, 10, 10]
+    assert elapsed >= 0.18
+
+
+def test_token_bucket_rejects_more_than_capacity():
+    with pytest.raises(ValueError):
+        asyncio.run(TokenBucket(rate=1, capacity=5).acquire(6))
+
+
+def test_refresh_through_threaded_fetcher(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "_engine", database.create_database_engine(f"sqlite:///{tmp_path / 'weather.db'}"))
+    located = [(f"City {i}", latitude, longitude) for i, (latitude, longitude) in enumerate(_coordinates(7))]
+    fetcher = ThreadedFetcher(url=server.url, rate=10000)
+    try:
+        timings = refresh_cities(located, fetch_size=3, fetch=fetcher.fetch_many)
+    finally:
+        fetcher.close()
+        database._engine.dispose()
+    assert timings["errors"] == []
+    assert sorted(server.requests) == [1, 3, 3]
+    assert timings["rows"] == 7 * (HOURS + HOURS // 24)
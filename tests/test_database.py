@@ -0,0 +1,46 @@
+import sqlite3
+
+import pandas as pd
+
+import database
+from forecast import Forecast
+
+PARIS = "Paris, Île-de-France, France"
+
+
+def _legacy_database(path, hourly_rows):
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE hourly_data (city_name TEXT, Date TIMESTAMP, temperature_2m FLOAT, "
+        "relative_humidity_2m FLOAT, precipitation FLOAT, rain FLOAT, cloud_cover FLOAT)")
+    connection.execute("CREATE TABLE daily_data (city_name TEXT, Date TIMESTAMP, uv_index_max FLOAT)")
+    connection.executemany("INSERT INTO hourly_data VALUES (?, ?, ?, 0, 0, 0, 0)", hourly_rows)
+    connection.commit()
+    connection.close()
+
+
+def test_legacy_migration_merges_spellings_and_duplicate_hours(tmp_path):
+    path = tmp_path / "weather.db"
+    _legacy_database(path, [
+        ("paris", "2024-05-01 10:00:00.000000", 1.0),
+        ("PARIS", "2024-05-01 10:00:00.000000", 2.0),
+        ("Paris, France", "2024-05-01 11:00:00.000000", 3.0),
+        (None, "2024-05-01 10:00:00.000000", 4.0),
+        (None, "2024-05-01 10:00:00.000000", 5.0),
+        ("Atlantis", "2024-05-01 10:00:00.000000", 6.0),
+    ])
+    engine = database.create_database_engine(f"sqlite:///{path}")
+    try:
+        with engine.connect() as connection:
+            names = {name for name, in connection.exec_driver_sql("SELECT city_name FROM locations")}
+            rows = connection.exec_driver_sql(
+                "SELECT l.city_name, h.time, h.temperature_2m FROM hourly h "
+                "JOIN locations l ON l.location_id = h.location_id ORDER BY l.city_name, h.time").fetchall()
+            tables = {name for name, in connection.exec_driver_sql("SELECT name FROM sqlite_master")}
+    finally:
+        engine.dispose()
+    ten = int(pd.Timestamp("2024-05-01 10:00", tz="UTC").timestamp())
+    assert names == {"", "Atlantis", PARIS}
+    # One row per (location, hour); the most recently inserted one wins
+    assert rows == [("", ten, 5.0), ("Atlantis", ten, 6.0), (PARIS, ten, 2.0), (PARIS, ten + 3600, 3.0)]
+    assert not {"hourly_data", "daily_data"} & tables
@@ -0,0 +1,19 @@
+import os
+
+import numpy as np
+
+from gazetteer import build_gazetteer, load_gazetteer
+
+
+def test_rebuild_leaves_mapped_arrays_intact(tmp_path):
+    cache_dir = str(tmp_path / "gazetteer")
+    build_gazetteer(cache_dir=cache_dir)
+    loaded = load_gazetteer(cache_dir=cache_dir)
+    latitudes = np.array(loaded.lat)
+    names = os.listdir(cache_dir)
+
+    # A second build swaps new files in; the first reader keeps its maps
+    build_gazetteer(cache_dir=cache_dir)
+    assert np.array_equal(np.asarray(loaded.lat), latitudes)
+    assert sorted(os.listdir(cache_dir)) == sorted(names)
+    assert load_gazetteer(cache_dir=cache_dir).value("city", 0) == loaded.value("city", 0)
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+import database
+from archive import compact, iter_archive
+from rollups import rebuild_rollups
+
+ROLLUP_COLUMNS = "location_id, variable, period, bucket, count, sum, m2, min, max, sketch"
+
+
+def _hourly(city_name, start, hours, seed):
+    rng = np.random.default_rng(seed)
+    values = rng.random((hours, len(database.HOURLY_COLUMNS))) * 30
+    values[rng.random(values.shape) < 0.05] = np.nan
+    frame = pd.DataFrame(values, columns=database.HOURLY_COLUMNS)
+    frame.insert(0, "date", pd.date_range(start, periods=hours, freq="h", tz="UTC"))
+    frame.insert(1, "city_name", city_name)
+    return frame
+
+
+def _daily(hourly):
+    daily = hourly.groupby(hourly["date"].dt.floor("D")).agg(city_name=("city_name", "first"))
+    daily["uv_index_max"] = np.arange(len(daily), dtype=float)
+    return daily.reset_index()
+
+
+def _rollups(connection):
+    return connection.exec_driver_sql(f"SELECT {ROLLUP_COLUMNS} FROM rollups ORDER BY 1, 2, 3, 4").fetchall()
+
+
+def test_incremental_rollups_match_a_rebuild(tmp_path):
+    engine = database.create_database_engine(f"sqlite:///{tmp_path / 'weather.db'}")
+    try:
+        # Overlapping fetches across week and month boundaries: new hours,
+        # changed hours and hours stored again unchanged
+        batches = [
+            [_hourly("Paris", "2024-04-25", 240, 0), _hourly("Berlin", "2024-04-28", 240, 1)],
+            [_hourly("Paris", "2024-04-30", 240, 2), _hourly("Berlin", "2024-04-28", 240, 1)],
+            [_hourly("Paris", "2024-05-06", 96, 3)],
+        ]
+        for frames in batches:
+            database.store_frames(frames, [_daily(frame) for frame in frames], engine=engine)
+        with engine.begin() as connection:
+            incremental = _rollups(connection)
+            connection.exec_driver_sql("DELETE FROM rollups")
+            rebuild_rollups(connection, "hourly", database.HOURLY_COLUMNS)
+            rebuild_rollups(connection, "daily", database.DAILY_COLUMNS)
+            rebuilt = _rollups(connection)
+    finally:
+        engine.dispose()
+    assert len(incremental) == len(rebuilt) > 0
+    for got, expected in zip(incremental, rebuilt):
+        assert got[:5] == expected[:5]
+        assert np.allclose(got[5:9], expected[5:9])
+        assert got[9] == expected[9]
+
+
+def test_compact_moves_old_months_to_the_archive(tmp_path):
+    engine = database.create_database_engine(f"sqlite:///{tmp_path / 'weather.db'}")
+    archive_dir = str(tmp_path / "archive")
+    hourly = _hourly("Paris", "2024-04-25", 240, 0)
+    try:
+        database.store_frames([hourly], engine=engine)
+        archived = compact("hourly", now=pd.Timestamp("2024-07-01", tz="UTC"), engine=engine, archive_dir=archive_dir)
+        with engine.connect() as connection:
+            left = connection.exec_driver_sql("SELECT COUNT(*) FROM hourly").scalar()
+    finally:
+        engine.dispose()
+    assert archived == len(hourly)
+    assert left == 0
+    restored = pd.concat(iter_archive("hourly", "Paris", archive_dir=archive_dir), ignore_index=True)
+    assert restored["date"].tolist() == hourly["date"].tolist()
+    assert np.allclose(
+        restored[database.HOURLY_COLUMNS].to_numpy(np.float64),
+        hourly[database.HOURLY_COLUMNS].to_numpy(np.float32).astype(np.float64), equal_nan=True)
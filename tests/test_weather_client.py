@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+from requests_cache.models import CachedRequest, CachedResponse
+
+from cache_policy import ForecastCyclePolicy
+from weather_client import WeatherClient
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+
+def _save(client, latitude, created, expires):
+    request = requests.Request("GET", f"{FORECAST_URL}?latitude={latitude}&longitude=2.35").prepare()
+    key = client.session.cache.create_key(request)
+    client.session.cache.responses[key] = CachedResponse(
+        url=request.url, status_code=200, request=CachedRequest.from_request(request),
+        created_at=created, expires=expires)
+    return key
+
+
+def test_boundary_change_offline_keeps_expired_responses_expired(tmp_path):
+    # No models, so no metadata: the policy is on its hourly fallback, as
+    # it is offline or with meta.json failing
+    client = WeatherClient(cache_name=str(tmp_path / "cache"), policy=ForecastCyclePolicy(models=()))
+    now = datetime.now(timezone.utc)
+    stale = _save(client, 48.85, datetime(2024, 5, 1, 10, 20, tzinfo=timezone.utc),
+                  datetime(2024, 5, 1, 11, tzinfo=timezone.utc))
+    fresh = _save(client, 40.71, now, now + timedelta(minutes=5))
+    # An expiry boundary from the previous hour, so the next call moves it
+    client.session.settings.expire_after = client.policy.expire_after(now.timestamp() - 3600)
+    try:
+        client.revalidate()
+        responses = client.session.cache.responses
+        assert responses[stale].is_expired
+        assert responses[stale].expires == datetime(2024, 5, 1, 11, tzinfo=timezone.utc)
+        assert not responses[fresh].is_expired
+        assert responses[fresh].expires == client.policy.expire_after(now.timestamp())
+    finally:
+        client.close()
+
+
+def test_responses_from_before_the_latest_run_are_not_restamped(tmp_path):
+    policy = ForecastCyclePolicy(models=())
+    client = WeatherClient(cache_name=str(tmp_path / "cache"), policy=policy)
+    now = datetime.now(timezone.utc)
+    before = now - timedelta(minutes=30)
+    older = _save(client, 48.85, before, now + timedelta(minutes=1))
+    # A run landed after ``older`` was fetched, but the delete for it has
+    # not happened yet
+    policy._runs = {"model": (now - timedelta(minutes=10)).timestamp()}
+    client.session.settings.expire_after = policy.expire_after(now.timestamp() - 3600)
+    try:
+        client.revalidate()
+        assert client.session.cache.responses[older].expires == now + timedelta(minutes=1)
+    finally:
+        client.close()
@@ -1,5 +1,7 @@
 import customtkinter as tk
 from city_input import get_all_city_names
+from autocomplete import get_autocomplete
+from fuzzy_search import suggest_cities
 from CTkListbox import *
 
 def create_gui(fetch_weather_callback):
@@ -9,6 +11,7 @@ def create_gui(fetch_weather_callback):
     myfont = tk.CTkFont(family="Calibri", size=20)
 
     city_names = get_all_city_names()
+    completer = get_autocomplete()
 
     combobox_var = tk.StringVar(value="")
     city_entry = tk.CTkComboBox(root, width = 250, values=city_names, variable=combobox_var)
@@ -16,9 +19,7 @@ def create_gui(fetch_weather_callback):
 
     def checkkey(event):
         value = city_entry.get()
-        city_list = city_names
-
-        city_list = [city for city in city_list if city.lower().startswith(value.lower())][:5]
+        city_list = completer.complete(value, 5) or suggest_cities(value, 5)
         
         update_suggestions(city_list)
         
@@ -38,4 +39,17 @@ def create_gui(fetch_weather_callback):
     weather_text = tk.CTkTextbox(root, font=myfont, width=400, scrollbar_button_color="Orange", corner_radius=16, border_color="Orange", border_width=2)
     weather_text.grid(row=3, column=1, padx=5, pady=5)
 
-    return root, city_entry, weather_text
\ No newline at end of file
+    # Shown while a fetch runs in the background
+    progress_bar = tk.CTkProgressBar(root, mode="indeterminate", progress_color="orange")
+    progress_bar.grid(row=1, column=1, columnspan=2, padx=5, pady=5, sticky="ew")
+    progress_bar.grid_remove()
+
+    def show_progress(busy):
+        if busy:
+            progress_bar.grid()
+            progress_bar.start()
+        else:
+            progress_bar.stop()
+            progress_bar.grid_remove()
+
+    return root, city_entry, weather_text, show_progress
\ No newline at end of file
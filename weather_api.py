@@ -1,26 +1,73 @@
-import openmeteo_requests
-import requests_cache
-from retry_requests import retry
+from weather_client import get_client
+from singleflight import SingleFlight
 
-def fetch_weather_data(latitude, longitude,):
-    # Setup the Open-Meteo API client with cache and retry on error
-    cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-    retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-    openmeteo = openmeteo_requests.Client(session=retry_session)
-
-    # Make sure all required weather variables are listed here
-    # The order of variables in hourly or daily is important to assign them correctly below
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": latitude,
-        "longitude": longitude,
-        "hourly": ["temperature_2m", "relative_humidity_2m", "precipitation", "rain", "cloud_cover"],
-        "daily": "uv_index_max",
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+# Make sure all required weather variables are listed here
+# The order of variables in hourly or daily is important to assign them correctly below
+HOURLY_VARIABLES = ["temperature_2m", "relative_humidity_2m", "precipitation", "rain", "cloud_cover"]
+DAILY_VARIABLES = ["uv_index_max"]
+
+# Open-Meteo rejects overly long URLs and caps locations per request
+MAX_LOCATIONS_PER_REQUEST = 100
+MAX_URL_LENGTH = 8000
+
+# Identical requests made at the same time share a single network call
+fetch_coalescer = SingleFlight()
+
+def forecast_params(latitudes, longitudes):
+    # Several locations are sent as comma-separated coordinate lists
+    return {
+        "latitude": ",".join(str(latitude) for latitude in latitudes),
+        "longitude": ",".join(str(longitude) for longitude in longitudes),
+        "hourly": HOURLY_VARIABLES,
+        "daily": DAILY_VARIABLES,
         "timezone": "auto",
         "past_days": 3
     }
-    responses = openmeteo.weather_api(url, params=params)
 
-    # Process first location. Add a for-loop for multiple locations or weather models
-    response = responses[0]
-    return response
+def chunk_coordinates(coordinates, max_locations=MAX_LOCATIONS_PER_REQUEST, max_url_length=MAX_URL_LENGTH):
+    # Greedily fill each request up to the location and URL length limits;
+    # a comma is sent URL-encoded as "%2C"
+    base_length = len(FORECAST_URL) + 300
+    chunk, length = [], base_length
+    for latitude, longitude in coordinates:
+        cost = len(str(latitude)) + len(str(longitude)) + 6
+        if chunk and (len(chunk) == max_locations or length + cost > max_url_length):
+            yield chunk
+            chunk, length = [], base_length
+        chunk.append((latitude, longitude))
+        length += cost
+    if chunk:
+        yield chunk
+
+def request_key(latitude, longitude, precision=4):
+    # Coordinates rounded to ~10 m plus the (fixed) request parameters
+    params = forecast_params([], [])
+    del params["latitude"], params["longitude"]
+    frozen = tuple(sorted((key, tuple(value) if isinstance(value, list) else value) for key, value in params.items()))
+    return round(float(latitude), precision), round(float(longitude), precision), frozen
+
+def _fetch_uncoalesced(coordinates, max_locations, max_url_length):
+    openmeteo = get_client()
+    responses = []
+    for chunk in chunk_coordinates(coordinates, max_locations, max_url_length):
+        latitudes, longitudes = zip(*chunk)
+        chunk_responses = openmeteo.weather_api(FORECAST_URL, params=forecast_params(latitudes, longitudes))
+        if len(chunk_responses) != len(chunk):
+            raise ValueError(f"Expected {len(chunk)} responses, got {len(chunk_responses)}")
+        responses.extend(chunk_responses)
+    return responses
+
+def fetch_weather_data_batch(coordinates, max_locations=MAX_LOCATIONS_PER_REQUEST, max_url_length=MAX_URL_LENGTH):
+    # One request per chunk; Open-Meteo answers with one response per
+    # location in request order, so results line up with ``coordinates``.
+    # Locations another caller is already fetching are waited on, not refetched
+    coordinates = list(coordinates)
+    keys = [request_key(latitude, longitude) for latitude, longitude in coordinates]
+    return fetch_coalescer.do_many(
+        keys,
+        lambda owned: _fetch_uncoalesced([coordinates[i] for i in owned], max_locations, max_url_length))
+
+def fetch_weather_data(latitude, longitude,):
+    return fetch_weather_data_batch([(latitude, longitude)])[0]
\ No newline at end of file
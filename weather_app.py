@@ -1,49 +1,33 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import customtkinter as tk
-import sqlalchemy as db
-import openmeteo_requests
-import requests_cache
-from retry_requests import retry
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
-
-
-# API Calls
-def fetch_weather_data(latitude, longitude):
-    cache_session = requests_cache.CachedSession(".cache", expire_after=3600)
-    retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-    openmeteo = openmeteo_requests.Client(session=retry_session)
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": latitude,
-        "longitude": longitude,
-        "hourly": [
-            "temperature_2m",
-            "relative_humidity_2m",
-            "precipitation",
-            "rain",
-            "cloud_cover",
-        ],
-        "daily": "uv_index_max",
-        "timezone": "auto",
-        "past_days": 3,
-    }
-    response = openmeteo.weather_api(url, params=params)
-    return response[0]
+from gazetteer import get_gazetteer
+from database import store_forecast
+from weather_stats import compute_stats
+from history import city_timezone, read_hourly
+from weather_api import HOURLY_VARIABLES, fetch_weather_data, request_key
+from forecast import Forecast
+from dashboard import DashboardFigure, get_color_gradient
+from downsample import plot_downsampled
+from forecast_cache import ForecastCache
+from weather_client import get_client
+from city_index import get_city_index
+from city_input import resolve_city
+from autocomplete import get_autocomplete
+from fuzzy_search import suggest_cities
+from background import BackgroundRunner
 
 
 # Get City Data
 def get_city_coordinates(city_name):
     try:
-        city_data = pd.read_excel(
-            "worldcities/worldcities.xlsx", usecols=["city", "lat", "lng"]
-        )
-        city_info = city_data[city_data["city"] == city_name]
-        if not city_info.empty:
-            latitude, longitude = city_info.iloc[0][["lat", "lng"]]
-            return latitude, longitude
+        city_index = get_city_index()
+        row = city_index.resolve_label(city_name)
+        if row is not None:
+            return city_index.gazetteer.coordinates(row)
         else:
             print("City not found in database.")
             return None, None
@@ -53,100 +37,51 @@ def get_city_coordinates(city_name):
 
 
 def get_all_city_names():
-    df = pd.read_excel("worldcities/worldcities.xlsx", usecols=["city"])
-    return df["city"].tolist()
+    return get_gazetteer().city_names()
 
 
 # Data Processing
 def process_hourly_data(response, city_name):
-    hourly = response.Hourly()
-    hourly_data = {
-        "date": pd.date_range(
-            start=pd.to_datetime(hourly.Time(), unit="s", utc=True),
-            end=pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
-            freq=pd.Timedelta(seconds=hourly.Interval()),
-            inclusive="left",
-        ),
-        "city_name": city_name,
-        "temperature_2m": hourly.Variables(0).ValuesAsNumpy(),
-        "relative_humidity_2m": hourly.Variables(1).ValuesAsNumpy(),
-        "precipitation": hourly.Variables(2).ValuesAsNumpy(),
-        "rain": hourly.Variables(3).ValuesAsNumpy(),
-        "cloud_cover": hourly.Variables(4).ValuesAsNumpy(),
-    }
-    return pd.DataFrame(data=hourly_data)
+    return Forecast.from_response(response, city_name).hourly_dataframe()
 
 
 def process_daily_data(response, city_name):
-    daily = response.Daily()
-    daily_data = {
-        "date": pd.date_range(
-            start=pd.to_datetime(daily.Time(), unit="s", utc=True),
-            end=pd.to_datetime(daily.TimeEnd(), unit="s", utc=True),
-            freq=pd.Timedelta(seconds=daily.Interval()),
-            inclusive="left",
-        ),
-        "city_name": city_name,
-        "uv_index_max": daily.Variables(0).ValuesAsNumpy(),
-    }
-    return pd.DataFrame(data=daily_data)
+    return Forecast.from_response(response, city_name).daily_dataframe()
+
 
+# Processed forecasts per location, checked before the HTTP cache. They
+# expire together with it, when the next model run is due
+forecast_cache = ForecastCache(expiry=lambda now: get_client().policy.expires_at(now))
 
-# Store Data
-def store_hourly_data(hourly_dataframe):
-    engine = db.create_engine("sqlite:///weather_data.db")
-    hourly_dataframe.to_sql(
-        "hourly_data",
-        con=engine,
-        if_exists="append",
-        index=False)
 
+def load_forecast(city_name, latitude, longitude):
+    # Fetching, decoding and storing only happen on a cache miss; a hit
+    # returns the Forecast (and any DataFrames) built for the last request
+    def load():
+        forecast = Forecast.from_response(fetch_weather_data(latitude, longitude), city_name)
+        store_forecast(forecast.hourly_dataframe(), forecast.daily_dataframe(), forecast.timezone)
+        return forecast
 
-def store_daily_data(daily_dataframe):
-    engine = db.create_engine("sqlite:///weather_data.db")
-    daily_dataframe.to_sql(
-        "daily_data",
-        con=engine,
-        if_exists="append",
-        index=False)
+    key = (city_name,) + request_key(latitude, longitude)
+    return forecast_cache.get_or_load(key, load)
 
 
 # Analysis Functions
-def analyze_data(data, column):
-    mean_val = data[column].mean()
-    median_val = data[column].median()
-    max_val = data[column].max()
-    min_val = data[column].min()
-    std_val = data[column].std()
-    range_val = max_val - min_val
-    q1 = data[column].quantile(0.25)
-    q3 = data[column].quantile(0.75)
-    iqr = q3 - q1
-
-    peaks = data[data[column] > (mean_val + std_val)]
-    troughs = data[data[column] < (mean_val - std_val)]
-
-    analysis_report = f"""
-    Analysis for {column.replace('_', ' ').title()}:
-    - Mean: {mean_val:.2f}
-    - Median: {median_val:.2f}
-    - Max: {max_val:.2f}
-    - Min: {min_val:.2f}
-    - Std Dev: {std_val:.2f}
-    - Range: {range_val:.2f}
-    - Interquartile Range (IQR): {iqr:.2f}
-    - Number of Peaks: {len(peaks)}
-    - Number of Troughs: {len(troughs)}
-    """
-    return analysis_report
-
-
-def generate_weather_description(hourly_dataframe):
+def analyze_data(data, column, stats=None):
+    # ``stats`` from compute_stats covering ``column`` saves recomputing it
+    if stats is None or column not in stats:
+        stats = compute_stats(data, [column])
+    return stats.report(column)
+
+
+def generate_weather_description(hourly_dataframe, stats=None):
+    if stats is None:
+        stats = compute_stats(hourly_dataframe, HOURLY_VARIABLES)
     descriptions = []
-    temp_mean = hourly_dataframe["temperature_2m"].mean()
-    humidity_mean = hourly_dataframe["relative_humidity_2m"].mean()
-    precip_sum = hourly_dataframe["precipitation"].sum()
-    cloud_cover_mean = hourly_dataframe["cloud_cover"].mean()
+    temp_mean = stats["temperature_2m"]["mean"]
+    humidity_mean = stats["relative_humidity_2m"]["mean"]
+    precip_sum = stats["precipitation"]["sum"]
+    cloud_cover_mean = stats["cloud_cover"]["mean"]
 
     descriptions.append(
         f"The average temperature over the past hours was {temp_mean:.2f}°C.")
@@ -172,14 +107,23 @@ def generate_weather_description(hourly_dataframe):
 
 
 # Calculate Local Time of City
-def get_local_time(response):
-    timezone = response.Timezone()
+def get_local_time(timezone):
     local_time = datetime.now(pytz.timezone(timezone))
     return local_time
 
 
+def get_stored_local_time(city_name):
+    # The timezone saved with the city's last forecast; for data stored
+    # before that, solar time from the longitude
+    tz_name = city_timezone(city_name)
+    if tz_name:
+        return get_local_time(tz_name)
+    latitude, longitude = get_city_coordinates(city_name)
+    return datetime.now(pytz.utc) + timedelta(hours=(longitude or 0) / 15)
+
+
 # Plotting Functions
-def plot_in_new_window(data, title, xlabel, ylabel, local_time):
+def plot_in_new_window(data, title, xlabel, ylabel, local_time, stats=None):
     new_window = tk.CTkToplevel()
     new_window.title(title)
     new_window._state_before_windows_set_titlebar_color = "zoomed"
@@ -188,7 +132,10 @@ def plot_in_new_window(data, title, xlabel, ylabel, local_time):
     plot_color, fg_color, bg_color = get_color_gradient(local_time.hour)
 
     fig.patch.set_facecolor(bg_color)
-    ax.plot(
+    # Long stored histories are reduced to what the axes can show, and
+    # re-reduced as the toolbar zooms or pans
+    plot_downsampled(
+        ax,
         data["date"],
         data[ylabel],
         marker="o",
@@ -206,9 +153,10 @@ def plot_in_new_window(data, title, xlabel, ylabel, local_time):
 
     canvas = FigureCanvasTkAgg(fig, new_window)
     canvas.draw()
+    NavigationToolbar2Tk(canvas, new_window)
     canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
-    analysis_report = analyze_data(data, ylabel)
+    analysis_report = analyze_data(data, ylabel, stats)
 
     text_box = tk.CTkTextbox(
         new_window,
@@ -231,190 +179,155 @@ def get_sky_color(time_of_day):
         return "royalblue"
 
 
-def get_color_gradient(time_of_day):
-    if 6 <= time_of_day < 12:
-        plot_color = "whitesmoke"
-        fg_color = "deepskyblue"
-        bg_color = "deepskyblue"
-    elif 12 <= time_of_day < 18:
-        plot_color = "bisque"
-        fg_color = "coral"
-        bg_color = "coral"
-    elif 18 <= time_of_day < 20:
-        plot_color = "lightpink"
-        fg_color = "slateblue"
-        bg_color = "slateblue"
-    else:
-        plot_color = "royalblue"
-        fg_color = "black"
-        bg_color = "black"
-    return plot_color, fg_color, bg_color
-
-
-def visualize_hourly_weather(hourly_dataframe, canvas, local_time):
-    fig, axs = plt.subplots(3, 2, figsize=(12, 8))
-
-    plot_color, fg_color, bg_color = get_color_gradient(local_time.hour)
-
-    fig.patch.set_facecolor(bg_color)
-    axs[0, 0].plot(
-        hourly_dataframe["date"],
-        hourly_dataframe["temperature_2m"],
-        marker="o",
-        linestyle="-",
-        color=plot_color,
-    )
-    axs[0, 0].set_title("Hourly Temperature Variation", color=plot_color)
-    axs[0, 0].set_xlabel("Date", color=plot_color)
-    axs[0, 0].set_ylabel("Temperature (°C)", color=plot_color)
-    axs[0, 0].set_facecolor(fg_color)
-    axs[0, 0].tick_params(axis="x", rotation=45, colors=plot_color)
-    axs[0, 0].tick_params(axis="y", colors=plot_color)
-    axs[0, 0].grid(True, color=plot_color)
-
-    axs[0, 1].plot(
-        hourly_dataframe["date"],
-        hourly_dataframe["relative_humidity_2m"],
-        marker="o",
-        linestyle="-",
-        color=plot_color,
-    )
-    axs[0, 1].set_title("Hourly Humidity Variation", color=plot_color)
-    axs[0, 1].set_xlabel("Date", color=plot_color)
-    axs[0, 1].set_ylabel("Relative Humidity (%)", color=plot_color)
-    axs[0, 1].set_facecolor(fg_color)
-    axs[0, 1].tick_params(axis="x", rotation=45, colors=plot_color)
-    axs[0, 1].tick_params(axis="y", colors=plot_color)
-    axs[0, 1].grid(True, color=plot_color)
-
-    axs[1, 0].plot(
-        hourly_dataframe["date"],
-        hourly_dataframe["precipitation"],
-        marker="o",
-        linestyle="-",
-        color=plot_color,
-    )
-    axs[1, 0].set_title("Hourly Precipitation Variation", color=plot_color)
-    axs[1, 0].set_xlabel("Date", color=plot_color)
-    axs[1, 0].set_ylabel("Precipitation (mm)", color=plot_color)
-    axs[1, 0].set_facecolor(fg_color)
-    axs[1, 0].tick_params(axis="x", rotation=45, colors=plot_color)
-    axs[1, 0].tick_params(axis="y", colors=plot_color)
-    axs[1, 0].grid(True, color=plot_color)
-
-    axs[1, 1].plot(
-        hourly_dataframe["date"],
-        hourly_dataframe["rain"],
-        marker="o",
-        linestyle="-",
-        color=plot_color,
-    )
-    axs[1, 1].set_title("Hourly Rain Variation", color=plot_color)
-    axs[1, 1].set_xlabel("Date", color=plot_color)
-    axs[1, 1].set_ylabel("Rain (mm)", color=plot_color)
-    axs[1, 1].set_facecolor(fg_color)
-    axs[1, 1].tick_params(axis="x", rotation=45, colors=plot_color)
-    axs[1, 1].tick_params(axis="y", colors=plot_color)
-    axs[1, 1].grid(True, color=plot_color)
-
-    axs[2, 0].plot(
-        hourly_dataframe["date"],
-        hourly_dataframe["cloud_cover"],
-        marker="o",
-        linestyle="-",
-        color=plot_color,
-    )
-    axs[2, 0].set_title("Hourly Cloud Cover Variation", color=plot_color)
-    axs[2, 0].set_xlabel("Date", color=plot_color)
-    axs[2, 0].set_ylabel("Cloud Cover (%)", color=plot_color)
-    axs[2, 0].set_facecolor(fg_color)
-    axs[2, 0].tick_params(axis="x", rotation=45, colors=plot_color)
-    axs[2, 0].tick_params(axis="y", colors=plot_color)
-    axs[2, 0].grid(True, color=plot_color)
+class WeatherDashboard:
+    # The hourly panels live in one figure and one Tk canvas for the whole
+    # session. A new city or refresh only updates the lines and blits them
+    # over the saved background; the full redraw happens only when the
+    # colours or the (snapped) axis limits change
+    def __init__(self, master):
+        self.view = DashboardFigure(animated=True)
+        self.canvas = FigureCanvasTkAgg(self.view.figure, master)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.background = None
+        self.current = None
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+        self.canvas.mpl_connect("button_press_event", self.on_click)
+
+    def on_draw(self, event):
+        # Any full draw (including resizes) refreshes the saved background
+        self.background = self.canvas.copy_from_bbox(self.view.figure.bbox)
+        self.view.draw_lines()
+
+    def on_click(self, event):
+        panel = self.view.panel_at(event)
+        if panel is None or self.current is None:
+            return
+        column, title = panel
+        hourly_dataframe, local_time, stats = self.current
+        plot_in_new_window(hourly_dataframe, title, "Date", column, local_time, stats)
+
+    def show(self, hourly_dataframe, local_time, stats=None):
+        if stats is None:
+            stats = compute_stats(hourly_dataframe, HOURLY_VARIABLES)
+        self.current = (hourly_dataframe, local_time, stats)
+        restyled = self.view.set_colors(*get_color_gradient(local_time.hour))
+        rescaled = self.view.set_dataframe(hourly_dataframe)
+        if restyled or rescaled or self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.view.draw_lines()
+        self.canvas.blit(self.view.figure.bbox)
 
-    axs[2, 1].axis("off")
+# Display Data
 
-    fig.tight_layout()
 
-    canvas = FigureCanvasTkAgg(fig, canvas)
-    canvas.draw()
-    canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+def load_weather(city_name, cancelled):
+    # Runs on a worker thread: network, processing, storage and statistics
+    # happen here so the Tk event loop stays responsive
+    location, latitude, longitude = resolve_city(city_name)
+    if location is None:
+        # Fall back to the closest spelling, e.g. "Amsterdm" -> "Amsterdam"
+        suggestions = suggest_cities(city_name, 1)
+        if not suggestions:
+            return None
+        location, latitude, longitude = resolve_city(suggestions[0])
+    # From here on the city goes by its canonical name, which is what the
+    # database and the forecast cache are keyed on
+    city_name = location
+
+    forecast = load_forecast(city_name, latitude, longitude)
+    if cancelled.is_set():
+        return None
+
+    hourly_dataframe = forecast.hourly_dataframe()
+    local_time = get_local_time(forecast.timezone)
+    stats = compute_stats(hourly_dataframe, HOURLY_VARIABLES)
+    return {
+        "city_name": city_name,
+        "latitude": latitude,
+        "longitude": longitude,
+        "forecast": forecast,
+        "local_time": local_time,
+        "hourly_dataframe": hourly_dataframe,
+        "stats": stats,
+        "weather_description": generate_weather_description(hourly_dataframe, stats),
+    }
 
-    def on_click(event, ax, title, ylabel):
-        if event.inaxes == ax:
-            plot_in_new_window(
-                hourly_dataframe,
-                title,
-                "Date",
-                ylabel,
-                local_time)
-
-    fig.canvas.mpl_connect(
-        "button_press_event",
-        lambda event: on_click(
-            event, axs[0, 0], "Hourly Temperature Variation", "temperature_2m"
-        ),
-    )
-    fig.canvas.mpl_connect(
-        "button_press_event",
-        lambda event: on_click(
-            event, axs[0, 1], "Hourly Humidity Variation", "relative_humidity_2m"
-        ),
-    )
-    fig.canvas.mpl_connect(
-        "button_press_event",
-        lambda event: on_click(
-            event, axs[1, 0], "Hourly Precipitation Variation", "precipitation"
-        ),
-    )
-    fig.canvas.mpl_connect(
-        "button_press_event",
-        lambda event: on_click(
-            event, axs[1, 1], "Hourly Rain Variation", "rain"
-        ),
-    )
-    fig.canvas.mpl_connect(
-        "button_press_event",
-        lambda event: on_click(
-            event, axs[2, 0], "Hourly Cloud Cover Variation", "cloud_cover"
-        ),
-    )
 
-# Display Data
+def load_stored_weather(city_name, cancelled, days=3):
+    # Whatever an earlier fetch stored for this city: the last few days and
+    # the rest of that forecast. Reading it takes milliseconds
+    city_name = resolve_city(city_name)[0]
+    if city_name is None:
+        return None
+    start = pd.Timestamp.now(tz="UTC").floor("h") - pd.Timedelta(days=days)
+    hourly_dataframe = read_hourly(city_name, start=start)
+    if hourly_dataframe.empty or cancelled.is_set():
+        return None
+    local_time = get_stored_local_time(city_name)
+    stats = compute_stats(hourly_dataframe, HOURLY_VARIABLES)
+    return {
+        "city_name": city_name,
+        "hourly_dataframe": hourly_dataframe,
+        "local_time": local_time,
+        "stats": stats,
+        "weather_description": generate_weather_description(hourly_dataframe, stats),
+    }
 
 
-def display_weather_info(city_entry, weather_text, description_text, canvas):
-    city_name = city_entry.get()
-    latitude, longitude = get_city_coordinates(city_name)
-    if latitude is None or longitude is None:
+def show_weather(result, city_entry, weather_text, description_text, dashboard):
+    if result is None:
         return
-
-    response = fetch_weather_data(latitude, longitude)
-    local_time = get_local_time(response)
+    city_name = result["city_name"]
+    if city_entry.get() != city_name:
+        city_entry.set(city_name)
 
     weather_text.configure(state="normal")
     weather_text.delete(1.0, tk.END)
     weather_text.insert(tk.END, f"City Name: {city_name}\n")
-    weather_text.insert(tk.END, f"Coordinates: {latitude}°N, {longitude}°E\n")
-    weather_text.insert(tk.END, f"Elevation: {response.Elevation()} m asl\n")
-    weather_text.insert(
-        tk.END,
-        f"Timezone: {response.Timezone()} {response.TimezoneAbbreviation()}\n")
+    if "forecast" in result:
+        latitude, longitude = result["latitude"], result["longitude"]
+        forecast = result["forecast"]
+        weather_text.insert(tk.END, f"Coordinates: {latitude}°N, {longitude}°E\n")
+        weather_text.insert(tk.END, f"Elevation: {forecast.elevation} m asl\n")
+        weather_text.insert(
+            tk.END,
+            f"Timezone: {forecast.timezone} {forecast.timezone_abbreviation}\n")
+    else:
+        weather_text.insert(tk.END, "Showing stored data, updating...\n")
     weather_text.configure(state="disabled")
 
-    hourly_dataframe = process_hourly_data(response, city_name)
-    daily_dataframe = process_daily_data(response, city_name)
+    dashboard.show(result["hourly_dataframe"], result["local_time"], result["stats"])
 
-    store_hourly_data(hourly_dataframe)
-    store_daily_data(daily_dataframe)
-    visualize_hourly_weather(hourly_dataframe, canvas, local_time)
-
-    weather_description = generate_weather_description(hourly_dataframe)
     description_text.configure(state="normal")
     description_text.delete(1.0, tk.END)
-    description_text.insert(tk.END, weather_description)
+    description_text.insert(tk.END, result["weather_description"])
     description_text.configure(state="disabled")
 
+
+def display_weather_info(
+        city_entry,
+        weather_text,
+        description_text,
+        dashboard,
+        runner):
+    # Picking another city replaces (and cancels) any fetch still in flight.
+    # Stored history is shown first unless the live result beats it
+    city_name = city_entry.get()
+    shown_live = []
+
+    def show_stored(result):
+        if not shown_live:
+            show_weather(result, city_entry, weather_text, description_text, dashboard)
+
+    def show_live(result):
+        shown_live.append(True)
+        show_weather(result, city_entry, weather_text, description_text, dashboard)
+
+    runner.submit(lambda cancelled: load_stored_weather(city_name, cancelled), show_stored)
+    runner.submit(lambda cancelled: load_weather(city_name, cancelled), show_live, replace=False)
+
 # GUI
 
 
@@ -430,6 +343,7 @@ def create_gui(fetch_weather_callback):
     myfont = tk.CTkFont(family="Calibri", size=20)
 
     city_names = get_all_city_names()
+    completer = get_autocomplete()
 
     combobox_var = tk.StringVar(value="")
     city_entry = tk.CTkComboBox(
@@ -441,8 +355,7 @@ def create_gui(fetch_weather_callback):
 
     def checkkey(event):
         value = city_entry.get()
-        city_list = [city for city in city_names if city.lower(
-        ).startswith(value.lower())][:5]
+        city_list = completer.complete(value, 5) or suggest_cities(value, 5)
         update_suggestions(city_list)
 
     def update_suggestions(city_list):
@@ -495,6 +408,30 @@ def create_gui(fetch_weather_callback):
         padx=5,
         pady=5,
         sticky="nsew")
+    dashboard = WeatherDashboard(canvas_frame)
+
+    progress_bar = tk.CTkProgressBar(
+        root,
+        mode="indeterminate",
+        progress_color="orange")
+    progress_bar.grid(
+        row=3,
+        column=1,
+        columnspan=2,
+        padx=5,
+        pady=5,
+        sticky="ew")
+    progress_bar.grid_remove()
+
+    def show_progress(busy):
+        if busy:
+            progress_bar.grid()
+            progress_bar.start()
+        else:
+            progress_bar.stop()
+            progress_bar.grid_remove()
+
+    runner = BackgroundRunner(root, on_busy=show_progress)
 
     root.grid_rowconfigure(2, weight=1)
     root.grid_columnconfigure(1, weight=1)
@@ -502,16 +439,17 @@ def create_gui(fetch_weather_callback):
 
     root.bind("<Escape>", lambda event: root.destroy())
 
-    return root, city_entry, weather_text, description_text, canvas_frame
+    return root, city_entry, weather_text, description_text, dashboard, runner
 
 # Main
 
 
 def main():
-    root, city_entry, weather_text, description_text, canvas_frame = create_gui(
+    root, city_entry, weather_text, description_text, dashboard, runner = create_gui(
         lambda: display_weather_info(
-            city_entry, weather_text, description_text, canvas_frame))
+            city_entry, weather_text, description_text, dashboard, runner))
     root.mainloop()
+    runner.shutdown()
 
 
 if __name__ == "__main__":
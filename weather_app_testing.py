@@ -2,48 +2,23 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import customtkinter as tk
-import sqlalchemy as db
-import openmeteo_requests
-import requests_cache
-from retry_requests import retry
 from datetime import datetime
 import pytz
-
-
-# API Calls
-def fetch_weather_data(latitude, longitude):
-    cache_session = requests_cache.CachedSession(".cache", expire_after=3600)
-    retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-    openmeteo = openmeteo_requests.Client(session=retry_session)
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": latitude,
-        "longitude": longitude,
-        "hourly": [
-            "temperature_2m",
-            "relative_humidity_2m",
-            "precipitation",
-            "rain",
-            "cloud_cover",
-        ],
-        "daily": "uv_index_max",
-        "timezone": "auto",
-        "past_days": 3,
-    }
-    response = openmeteo.weather_api(url, params=params)
-    return response[0]
+from gazetteer import get_gazetteer
+from database import store_forecast
+from weather_api import fetch_weather_data
+from city_index import get_city_index
+from autocomplete import get_autocomplete
+from fuzzy_search import suggest_cities
 
 
 # Get City Data
 def get_city_coordinates(city_name):
     try:
-        city_data = pd.read_excel(
-            "worldcities/worldcities.xlsx", usecols=["city", "lat", "lng"]
-        )
-        city_info = city_data[city_data["city"] == city_name]
-        if not city_info.empty:
-            latitude, longitude = city_info.iloc[0][["lat", "lng"]]
-            return latitude, longitude
+        city_index = get_city_index()
+        row = city_index.resolve_label(city_name)
+        if row is not None:
+            return city_index.gazetteer.coordinates(row)
         else:
             print("City not found in database.")
             return None, None
@@ -53,8 +28,7 @@ def get_city_coordinates(city_name):
 
 
 def get_all_city_names():
-    df = pd.read_excel("worldcities/worldcities.xlsx", usecols=["city"])
-    return df["city"].tolist()
+    return get_gazetteer().city_names()
 
 
 # Data Processing
@@ -92,25 +66,6 @@ def process_daily_data(response, city_name):
     return pd.DataFrame(data=daily_data)
 
 
-# Store Data
-def store_hourly_data(hourly_dataframe):
-    engine = db.create_engine("sqlite:///weather_data.db")
-    hourly_dataframe.to_sql(
-        "hourly_data",
-        con=engine,
-        if_exists="append",
-        index=False)
-
-
-def store_daily_data(daily_dataframe):
-    engine = db.create_engine("sqlite:///weather_data.db")
-    daily_dataframe.to_sql(
-        "daily_data",
-        con=engine,
-        if_exists="append",
-        index=False)
-
-
 # Analysis Functions
 def analyze_data(data, column):
     analysis_report = f"""
@@ -344,7 +299,13 @@ def display_weather_info(city_entry, weather_text, canvas):
     city_name = city_entry.get()
     latitude, longitude = get_city_coordinates(city_name)
     if latitude is None or longitude is None:
-        return
+        # Fall back to the closest spelling, e.g. "Amsterdm" -> "Amsterdam"
+        suggestions = suggest_cities(city_name, 1)
+        if not suggestions:
+            return
+        city_name = suggestions[0]
+        city_entry.set(city_name)
+        latitude, longitude = get_city_coordinates(city_name)
 
     response = fetch_weather_data(latitude, longitude)
     local_time = get_local_time(response)
@@ -362,8 +323,7 @@ def display_weather_info(city_entry, weather_text, canvas):
     hourly_dataframe = process_hourly_data(response, city_name)
     daily_dataframe = process_daily_data(response, city_name)
 
-    store_hourly_data(hourly_dataframe)
-    store_daily_data(daily_dataframe)
+    store_forecast(hourly_dataframe, daily_dataframe)
     visualize_hourly_weather(hourly_dataframe, canvas, local_time)
 
 
@@ -380,6 +340,7 @@ def create_gui(fetch_weather_callback):
     myfont = tk.CTkFont(family="Calibri", size=20)
 
     city_names = get_all_city_names()
+    completer = get_autocomplete()
 
     combobox_var = tk.StringVar(value="")
     city_entry = tk.CTkComboBox(
@@ -389,9 +350,7 @@ def create_gui(fetch_weather_callback):
 
     def checkkey(event):
         value = city_entry.get()
-        city_list = [
-            city for city in city_names if city.lower().startswith(value.lower())
-        ][:5]
+        city_list = completer.complete(value, 5) or suggest_cities(value, 5)
         update_suggestions(city_list)
 
     def update_suggestions(city_list):
@@ -0,0 +1,118 @@
+import threading
+import time
+from datetime import timezone
+
+import openmeteo_requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+from cache_policy import META_URL_PATTERN, META_URL_PREFIX, ForecastCyclePolicy
+
+
+class WeatherClient:
+    # One cached, retrying session shared by every caller, so the SQLite
+    # cache stays open and keep-alive connections are reused across fetches
+    def __init__(
+            self,
+            cache_name=".cache",
+            policy=None,
+            pool_size=10,
+            retries=5,
+            backoff_factor=0.2,
+            status_to_retry=(500, 502, 504)):
+        self.policy = policy or ForecastCyclePolicy()
+        # Model metadata is always revalidated; forecasts expire with the run
+        self.session = requests_cache.CachedSession(
+            cache_name,
+            expire_after=self.policy.expire_after(),
+            urls_expire_after={META_URL_PATTERN: requests_cache.EXPIRE_IMMEDIATELY})
+        retry = Retry(
+            total=retries,
+            read=retries,
+            connect=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_to_retry,
+            allowed_methods=None)
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        # Metadata checks sit in front of every fetch: fail fast, never retry
+        self.session.mount(META_URL_PREFIX, HTTPAdapter(max_retries=0))
+        self._client = openmeteo_requests.Client(session=self.session)
+        self._policy_lock = threading.Lock()
+
+    def _forecast_responses(self):
+        # Only responses still being served; an expired one stays expired
+        return (response for response in self.session.cache.filter(expired=False)
+                if "/static/meta.json" not in response.url)
+
+    def revalidate(self, force=False):
+        # Cheap check against the model schedule before serving from cache:
+        # responses created before the newest run are dropped, the rest are
+        # kept until the run after it is due. The metadata requests happen
+        # outside the lock; the policy lets one caller per check interval
+        # make them
+        landed = self.policy.refresh(self.session, force=force)
+        with self._policy_lock:
+            expires = self.policy.expire_after()
+            if landed is not None:
+                self.session.cache.delete(older_than=max(time.time() - landed, 0))
+            if expires != self.session.settings.expire_after:
+                self.session.settings.expire_after = expires
+                # Read everything before writing: a write while the filter
+                # cursor is still open waits on the cache's own lock forever
+                responses = list(self._forecast_responses())
+                latest_run = self.policy.latest_run()
+                with self.session.cache.responses.bulk_commit():
+                    for response in responses:
+                        created = response.created_at.replace(tzinfo=timezone.utc).timestamp()
+                        if latest_run is not None and created < latest_run:
+                            continue
+                        # Valid until the run after the one it was fetched
+                        # from, not after whatever is current now: without
+                        # metadata that is the next fallback boundary after
+                        # it was created, so it cannot be carried forward
+                        # hour after hour
+                        response.reset_expiration(self.policy.expire_after(created))
+                        self.session.cache.responses[response.cache_key] = response
+
+    def weather_api(self, url, params):
+        self.revalidate()
+        # The client writes format=flatbuffers into params; keep ours clean
+        return self._client.weather_api(url, params=dict(params))
+
+    def stats(self):
+        # urllib3 counts every request and every connection it had to open;
+        # the difference is requests served over a kept-alive connection
+        requests = new_connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                requests += pool.num_requests
+                new_connections += pool.num_connections
+        return {
+            "requests": requests,
+            "new_connections": new_connections,
+            "reused_connections": requests - new_connections,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = WeatherClient()
+    return _client
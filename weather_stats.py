@@ -0,0 +1,91 @@
+import numpy as np
+
+STATISTICS = (
+    "count", "sum", "mean", "median", "max", "min", "std",
+    "range", "q1", "q3", "iqr", "peaks", "troughs")
+
+
+class WeatherStats:
+    # Summary statistics for several columns, one array per statistic with
+    # one entry per column, e.g. ``stats.mean[stats.index("rain")]``.
+    # ``stats["rain"]`` gives the same numbers as a dict for one column
+    def __init__(self, columns, **values):
+        self.columns = list(columns)
+        self._positions = {column: i for i, column in enumerate(self.columns)}
+        for name in STATISTICS:
+            setattr(self, name, values[name])
+
+    def index(self, column):
+        return self._positions[column]
+
+    def __contains__(self, column):
+        return column in self._positions
+
+    def __getitem__(self, column):
+        i = self._positions[column]
+        return {name: getattr(self, name)[i].item() for name in STATISTICS}
+
+    def report(self, column):
+        return format_report(column, self[column])
+
+
+def compute_stats(data, columns):
+    # Everything comes from one sort of an (hours x columns) array: the
+    # extremes and quantiles are read off the sorted rows, while mean, std
+    # and the peak/trough counts are column reductions. NaNs are ignored,
+    # and quantiles interpolate linearly like pandas
+    values = np.asarray(data[list(columns)], dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    ordered = np.sort(values, axis=0)
+    count = (~np.isnan(values)).sum(axis=0)
+    columns_index = np.arange(values.shape[1])
+
+    def quantile(q):
+        position = q * np.maximum(count - 1, 0)
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, np.maximum(count - 1, 0))
+        fraction = position - low
+        result = ordered[low, columns_index] * (1 - fraction) + ordered[high, columns_index] * fraction
+        return np.where(count > 0, result, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = np.nansum(values, axis=0)
+        mean = total / count
+        std = np.where(count > 1, np.sqrt(np.nansum((values - mean) ** 2, axis=0) / (count - 1)), np.nan)
+        minimum = np.where(count > 0, ordered[0], np.nan)
+        maximum = np.where(count > 0, ordered[np.maximum(count - 1, 0), columns_index], np.nan)
+        q1, median, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+        peaks = (values > mean + std).sum(axis=0)
+        troughs = (values < mean - std).sum(axis=0)
+
+    return WeatherStats(
+        columns,
+        count=count,
+        sum=total,
+        mean=mean,
+        median=median,
+        max=maximum,
+        min=minimum,
+        std=std,
+        range=maximum - minimum,
+        q1=q1,
+        q3=q3,
+        iqr=q3 - q1,
+        peaks=peaks,
+        troughs=troughs)
+
+
+def format_report(column, stats):
+    return f"""
+    Analysis for {column.replace('_', ' ').title()}:
+    - Mean: {stats['mean']:.2f}
+    - Median: {stats['median']:.2f}
+    - Max: {stats['max']:.2f}
+    - Min: {stats['min']:.2f}
+    - Std Dev: {stats['std']:.2f}
+    - Range: {stats['range']:.2f}
+    - Interquartile Range (IQR): {stats['iqr']:.2f}
+    - Number of Peaks: {stats['peaks']}
+    - Number of Troughs: {stats['troughs']}
+    """